@@ -1,6 +1,7 @@
 import configparser
 import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+from sql_queries import create_table_queries, drop_table_queries, songplay_table_create
+from partitions import FACT_PARTITIONED, drop_fact_songplays, refresh_view
 
 
 def drop_tables(cur, conn):
@@ -12,6 +13,9 @@ def drop_tables(cur, conn):
             conn (psycopg2.connection): Connection object to commit transactions.
     """
     print(f"Dropping tables...")
+    # fact_songplays may be the partitioned view, which DROP TABLE can't remove
+    drop_fact_songplays(cur)
+    conn.commit()
     for query in drop_table_queries:
         cur.execute(query)
         conn.commit()
@@ -21,15 +25,24 @@ def create_tables(cur, conn):
     """
         Creates all tables listed in the `create_table_queries` list.
 
+        When `fact_songplays` is partitioned, an empty view is created in place of
+        the table; the monthly partitions are created by the ETL.
+
         Args:
             cur (psycopg2.cursor): Cursor object to execute SQL queries.
             conn (psycopg2.connection): Connection object to commit transactions.
     """
     print("Creating tables...")
     for query in create_table_queries:
+        if FACT_PARTITIONED and query == songplay_table_create:
+            continue
         cur.execute(query)
         conn.commit()
 
+    if FACT_PARTITIONED:
+        refresh_view(cur, partitions=[])
+        conn.commit()
+
 
 def main():
     config = configparser.ConfigParser()
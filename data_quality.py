@@ -0,0 +1,153 @@
+import time
+
+# Declared checks per table. Each table is validated with a single aggregate query:
+# - min_rows: fail if the table has fewer rows
+# - not_null: columns whose NULL count must not exceed `max_violations`
+# - primary_key: column whose duplicate count must not exceed `max_violations`
+#   (Redshift does not enforce PRIMARY KEY constraints)
+# - foreign_keys: column -> (table, column) whose orphan count must not exceed `max_violations`
+#   (Redshift does not enforce REFERENCES constraints either)
+quality_checks = {
+    "fact_songplays": {
+        "min_rows": 1,
+        "not_null": ["start_time", "user_id", "level", "song_id", "artist_id", "session_id",
+                     "location", "user_agent"],
+        "primary_key": "songplay_id",
+        "foreign_keys": {
+            "user_id": ("dim_users", "user_id"),
+            "song_id": ("dim_songs", "song_id"),
+            "artist_id": ("dim_artists", "artist_id"),
+            "start_time": ("dim_times", "start_time")
+        },
+        "max_violations": 0
+    },
+    "dim_users": {
+        "min_rows": 1,
+        "not_null": ["first_name", "last_name", "gender", "level"],
+        "primary_key": "user_id",
+        "max_violations": 0
+    },
+    "dim_songs": {
+        "min_rows": 1,
+        "not_null": ["title", "artist_id", "duration"],
+        "primary_key": "song_id",
+        "max_violations": 0
+    },
+    "dim_artists": {
+        "min_rows": 1,
+        "not_null": ["artist_name"],
+        "primary_key": "artist_id",
+        "max_violations": 0
+    },
+    "dim_times": {
+        "min_rows": 1,
+        "not_null": ["start_time", "hour", "day", "week", "month", "year", "weekday"],
+        "primary_key": "start_time",
+        "max_violations": 0
+    }
+}
+
+
+class DataQualityError(Exception):
+    """Raised when one or more data quality checks exceed their threshold."""
+
+
+def compile_check_query(table, checks):
+    """
+        Compile all checks declared for a table into one aggregate query.
+
+        Foreign keys are resolved with LEFT JOINs against the distinct keys of the
+        referenced tables, so the checked table itself is scanned only once.
+
+        Args:
+            table (str): Name of the table to check.
+            checks (dict): Checks declared for the table in `quality_checks`.
+
+        Returns:
+            tuple: (query, metric names in select order)
+    """
+    metrics = ["row_count"]
+    select = ["COUNT(*)"]
+
+    for column in checks.get("not_null", []):
+        metrics.append(f"null_{column}")
+        select.append(f"SUM(CASE WHEN t.{column} IS NULL THEN 1 ELSE 0 END)")
+
+    primary_key = checks.get("primary_key")
+    if primary_key:
+        metrics.append(f"duplicate_{primary_key}")
+        select.append(f"COUNT(t.{primary_key}) - COUNT(DISTINCT t.{primary_key})")
+
+    joins = []
+    for i, (column, (ref_table, ref_column)) in enumerate(checks.get("foreign_keys", {}).items()):
+        alias = f"fk{i}"
+        metrics.append(f"orphan_{column}")
+        select.append(f"SUM(CASE WHEN t.{column} IS NOT NULL AND {alias}.{ref_column} IS NULL THEN 1 ELSE 0 END)")
+        joins.append(f"LEFT JOIN (SELECT DISTINCT {ref_column} FROM {ref_table}) {alias} "
+                     f"ON t.{column} = {alias}.{ref_column}")
+
+    query = "SELECT {}\nFROM {} t\n{};".format(",\n       ".join(select), table, "\n".join(joins))
+    return query, metrics
+
+
+def evaluate_checks(table, checks, results):
+    """
+        Compare the measured metrics of a table against its thresholds.
+
+        Args:
+            table (str): Name of the checked table.
+            checks (dict): Checks declared for the table in `quality_checks`.
+            results (dict): Metric name -> measured value.
+
+        Returns:
+            list: Human readable descriptions of every breached check.
+    """
+    failures = []
+    min_rows = checks.get("min_rows", 0)
+    if results["row_count"] < min_rows:
+        failures.append(f"{table}: row_count {results['row_count']} < {min_rows}")
+
+    max_violations = checks.get("max_violations", 0)
+    for metric, value in results.items():
+        if metric != "row_count" and (value or 0) > max_violations:
+            failures.append(f"{table}: {metric} {value} > {max_violations}")
+    return failures
+
+
+def run_quality_checks(cur, checks=None):
+    """
+        Run the declared data quality checks, one aggregate query per table.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            checks (dict, optional): Checks per table. Defaults to `quality_checks`.
+
+        Returns:
+            dict: Table name -> {"metrics": dict, "duration": float} for every checked table.
+
+        Raises:
+            DataQualityError: If any check exceeds its threshold.
+    """
+    if checks is None:
+        checks = quality_checks
+
+    report = {}
+    failures = []
+    for table, table_checks in checks.items():
+        query, metrics = compile_check_query(table, table_checks)
+
+        start_time = time.time()
+        cur.execute(query)
+        results = dict(zip(metrics, cur.fetchone()))
+        duration = time.time() - start_time
+
+        report[table] = {"metrics": results, "duration": duration}
+        table_failures = evaluate_checks(table, table_checks, results)
+        failures.extend(table_failures)
+
+        status = "❌" if table_failures else "✅"
+        print(f"{status} {table}: {results['row_count']} rows checked in {duration:.4f} seconds")
+
+    if failures:
+        raise DataQualityError("🛑 Data quality checks failed:\n" + "\n".join(failures))
+    return report
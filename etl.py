@@ -1,52 +1,28 @@
 import configparser
 import psycopg2
-from sql_queries import copy_table_queries, insert_table_queries
+from data_quality import run_quality_checks
+from run_state import run_steps
 
 
-def load_staging_tables(cur, conn):
-    """
-       Loads data from S3 into Redshift staging tables.
-
-       Executes all COPY commands defined in the `copy_table_queries` list using the given
-       database cursor and commits each transaction.
-
-       Args:
-           cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
-           conn (psycopg2.extensions.connection): Connection object to commit transactions.
-    """
-    for query in copy_table_queries:
-        cur.execute(query)
-        conn.commit()
-
-
-def insert_tables(cur, conn):
-    """
-        Inserts data from staging tables into final analytics tables.
-
-        Executes all INSERT statements defined in the `insert_table_queries` list using the given
-        database cursor and commits each transaction.
-
-        Args:
-            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
-            conn (psycopg2.extensions.connection): Connection object to commit transactions.
-    """
-    for query in insert_table_queries:
-        cur.execute(query)
-        conn.commit()
+def main():
+    import argparse
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip steps already completed with unchanged inputs")
+    args = parser.parse_args()
 
-def main():
     config = configparser.ConfigParser()
     config.read('dwh.cfg')
 
     conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['DWH'].values()))
     cur = conn.cursor()
 
-    print("⏳ Loading staging tables...")
-    load_staging_tables(cur, conn)
+    print("⏳ Loading staging and analytical tables...")
+    run_steps(cur, conn, resume=args.resume)
 
-    print("⏳ Loading analytical tables...")
-    insert_tables(cur, conn)
+    print("⏳ Running data quality checks...")
+    run_quality_checks(cur)
 
     print("✅ Done loading tables!")
     conn.close()
@@ -0,0 +1,293 @@
+import configparser
+import glob
+import gzip
+import io
+import os
+import time
+import uuid
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from sql_queries import latest_record_insert, time_table_insert
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+DWH_ROLE_ARN = config.get('IAM_ROLE', 'ARN')
+TRANSFORM_PREFIX = config.get('S3', 'TRANSFORM_PREFIX', fallback='').strip("'")
+
+user_columns = ["user_id", "first_name", "last_name", "gender", "level"]
+time_columns = ["start_time", "hour", "day", "week", "month", "year", "weekday"]
+
+
+def read_json_files(directory):
+    """
+        Read every JSON (lines) file under a directory into one DataFrame.
+
+        Works for both the log files (one event per line) and the song files
+        (one song per file).
+
+        Args:
+            directory (str): Root directory, e.g. a local copy of `log_data` or `song_data`.
+
+        Returns:
+            pd.DataFrame: Concatenated records.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.json'), recursive=True))
+    frames = [pd.read_json(path, lines=True, dtype=False) for path in paths]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def next_song_events(events):
+    """
+        Select the NextSong events with a user, as the SQL transforms do.
+
+        Args:
+            events (pd.DataFrame): Raw log events.
+
+        Returns:
+            pd.DataFrame: Filtered events with `user_id` as integer and `ts` as int64 epoch ms.
+    """
+    user_id = pd.to_numeric(events["userId"].replace("", np.nan), errors="coerce")
+    mask = (events["page"] == "NextSong").to_numpy() & user_id.notna().to_numpy()
+    plays = events.loc[mask].copy()
+    plays["user_id"] = user_id[mask].astype("int64")
+    plays["ts"] = plays["ts"].astype("int64")
+    return plays
+
+
+def build_dim_users(plays):
+    """
+        Build `dim_users` rows, keeping each user's latest record.
+
+        Vectorized equivalent of `user_table_insert`: a stable sort on `ts` followed
+        by the last row of each user group.
+
+        Args:
+            plays (pd.DataFrame): Output of `next_song_events`.
+
+        Returns:
+            pd.DataFrame: One row per user with `user_columns`.
+    """
+    latest = plays.sort_values("ts", kind="stable").groupby("user_id", sort=True).tail(1)
+    users = latest.rename(columns={"firstName": "first_name", "lastName": "last_name"})
+    return users[user_columns].sort_values("user_id").reset_index(drop=True)
+
+
+def build_dim_times(plays, songs):
+    """
+        Build `dim_times` rows from the start times of matched song plays.
+
+        Vectorized equivalent of `time_table_insert`: the plays are matched to songs
+        on title and artist name like `songplays_table_insert`, and the distinct
+        start times are decomposed with vectorized datetime64 accessors.
+
+        Args:
+            plays (pd.DataFrame): Output of `next_song_events`.
+            songs (pd.DataFrame): Raw song metadata.
+
+        Returns:
+            pd.DataFrame: One row per distinct start time with `time_columns`.
+    """
+    matched = plays.merge(songs[["title", "artist_name"]].drop_duplicates(),
+                          left_on=["song", "artist"], right_on=["title", "artist_name"])
+    ts = np.unique(matched["ts"].to_numpy())
+    start_time = pd.to_datetime(ts, unit="ms")
+
+    # EXTRACT(week) is the ISO week and EXTRACT(dow) counts from Sunday = 0
+    return pd.DataFrame({
+        "start_time": start_time,
+        "hour": start_time.hour,
+        "day": start_time.day,
+        "week": start_time.isocalendar().week.to_numpy().astype("int64"),
+        "month": start_time.month,
+        "year": start_time.year,
+        "weekday": (start_time.dayofweek + 1) % 7
+    })[time_columns]
+
+
+def copy_dataframe(cur, s3, df, table, columns):
+    """
+        Replace the contents of a table with a DataFrame using one COPY.
+
+        The rows are written as a gzip CSV to `TRANSFORM_PREFIX` and loaded in the
+        caller's transaction; commit to publish them.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            s3 (boto3.client): S3 client.
+            df (pd.DataFrame): Rows to load.
+            table (str): Target table.
+            columns (list): Target columns, in the order of `df`.
+
+        Raises:
+            ValueError: If `TRANSFORM_PREFIX` is not set.
+    """
+    if not TRANSFORM_PREFIX:
+        raise ValueError("no S3 prefix to stage the rows in; set TRANSFORM_PREFIX under [S3] in dwh.cfg")
+
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz:
+        gz.write(df[columns].to_csv(index=False, header=False, date_format="%Y-%m-%d %H:%M:%S.%f").encode())
+
+    url = urlparse(TRANSFORM_PREFIX)
+    key = "{}/{}/{}.csv.gz".format(url.path.strip('/'), table, uuid.uuid4().hex)
+    s3.put_object(Bucket=url.netloc, Key=key, Body=buffer.getvalue())
+
+    cur.execute("DELETE FROM {};".format(table))
+    cur.execute(
+        """
+        COPY {} ({})
+        FROM 's3://{}/{}'
+        IAM_ROLE {}
+        CSV GZIP
+        TIMEFORMAT 'auto';
+        """.format(table, ", ".join(columns), url.netloc, key, DWH_ROLE_ARN)
+    )
+
+
+def fetch_table(cur, query):
+    """
+        Run a query and return its result as a DataFrame.
+    """
+    cur.execute(query)
+    col_names = [desc[0] for desc in cur.description]
+    return pd.DataFrame(cur.fetchall(), columns=col_names)
+
+
+def check_parity(cur, users, times, users_table="dim_users", times_table="dim_times"):
+    """
+        Compare locally built dimensions with the ones built by the SQL transforms.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            users (pd.DataFrame): Output of `build_dim_users`.
+            times (pd.DataFrame): Output of `build_dim_times`.
+            users_table (str): Table holding the SQL-built users.
+            times_table (str): Table holding the SQL-built times.
+
+        Returns:
+            dict: Dimension name -> True if the local and SQL rows are identical.
+    """
+    sql_users = fetch_table(cur, "SELECT {} FROM {} ORDER BY user_id;".format(", ".join(user_columns), users_table))
+    sql_times = fetch_table(cur, "SELECT {} FROM {} ORDER BY start_time;".format(", ".join(time_columns), times_table))
+
+    # DataFrame.equals also compares dtypes, so bring both sides to the same ones: the local
+    # start times are datetime64[ms] while the ones fetched with psycopg2 come back as [us]
+    time_dtypes = {"start_time": "datetime64[us]", **{c: "int64" for c in time_columns[1:]}}
+    sql_users["user_id"] = sql_users["user_id"].astype("int64")
+    sql_times["start_time"] = pd.to_datetime(sql_times["start_time"])
+    sql_times = sql_times.astype(time_dtypes)
+
+    local_times = times.sort_values("start_time").reset_index(drop=True).astype(time_dtypes)
+    return {
+        "dim_users": users.reset_index(drop=True).equals(sql_users),
+        "dim_times": local_times.equals(sql_times)
+    }
+
+
+def benchmark(cur, log_data, song_data, s3):
+    """
+        Time loading `dim_users` with the SQL transform against the local transform plus COPY.
+
+        Only `dim_users` is loaded through the local path; `dim_times` is always built
+        on the cluster from `fact_songplays`. Its local transform is run here only to
+        check parity. Both paths write into temporary tables, which are discarded when
+        the transaction is rolled back.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            log_data (str): Local directory with the log files loaded into staging.
+            song_data (str): Local directory with the song files loaded into staging.
+            s3 (boto3.client): S3 client.
+
+        Returns:
+            tuple: (timings per path and stage as a DataFrame, parity dict from `check_parity`)
+    """
+    for name, like in [("sql_users", "dim_users"), ("sql_times", "dim_times"), ("local_users", "dim_users")]:
+        cur.execute("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS);".format(name, like))
+
+    start_time = time.time()
+    cur.execute(latest_record_insert(
+        table="sql_users", columns=user_columns, source="staging_events", partition_key="user_id",
+        order_by="ts DESC", where="user_id IS NOT NULL AND page = 'NextSong'"))
+    sql_duration = time.time() - start_time
+    cur.execute(time_table_insert.replace("INSERT INTO dim_times", "INSERT INTO sql_times"))
+
+    start_time = time.time()
+    events, songs = read_json_files(log_data), read_json_files(song_data)
+    read_duration = time.time() - start_time
+
+    start_time = time.time()
+    plays = next_song_events(events)
+    users = build_dim_users(plays)
+    transform_duration = time.time() - start_time
+
+    start_time = time.time()
+    copy_dataframe(cur, s3, users, "local_users", user_columns)
+    copy_duration = time.time() - start_time
+
+    parity = check_parity(cur, users, build_dim_times(plays, songs), "sql_users", "sql_times")
+    cur.connection.rollback()
+
+    return pd.DataFrame([
+        ("sql", "dim_users transform on cluster", sql_duration),
+        ("local", "read JSON", read_duration),
+        ("local", "dim_users vectorized transform", transform_duration),
+        ("local", "dim_users COPY", copy_duration),
+        ("local", "total", read_duration + transform_duration + copy_duration),
+    ], columns=["path", "stage", "seconds"]), parity
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log-data", required=True, help="Local directory with the log JSON files")
+    parser.add_argument("--song-data", required=True, help="Local directory with the song JSON files")
+    parser.add_argument("--load", action="store_true",
+                        help="Replace dim_users with the local results and rebuild dim_times from fact_songplays")
+    parser.add_argument("--parity", action="store_true", help="Compare the local results with dim_users/dim_times")
+    parser.add_argument("--benchmark", action="store_true", help="Time the SQL and local transforms")
+    args = parser.parse_args()
+
+    if (args.load or args.benchmark) and not TRANSFORM_PREFIX:
+        parser.error("no S3 prefix to stage the rows in; set TRANSFORM_PREFIX under [S3] in dwh.cfg")
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+    cur = conn.cursor()
+    s3 = boto3.client('s3',
+                      aws_access_key_id=config.get('AWS', 'KEY'),
+                      aws_secret_access_key=config.get('AWS', 'SECRET'))
+
+    if args.benchmark:
+        timings, parity = benchmark(cur, args.log_data, args.song_data, s3)
+        print(timings.to_string(index=False))
+        print(f"🔍 Parity: {parity}")
+    else:
+        plays = next_song_events(read_json_files(args.log_data))
+        users = build_dim_users(plays)
+        times = build_dim_times(plays, read_json_files(args.song_data))
+        print(f"✅ Built {len(users)} users and {len(times)} times locally")
+
+        if args.parity:
+            print(f"🔍 Parity: {check_parity(cur, users, times)}")
+        if args.load:
+            copy_dataframe(cur, s3, users, "dim_users", user_columns)
+            # dim_times must cover every play in fact_songplays, including streamed ones, so
+            # it is rebuilt on the cluster rather than from the local log files
+            cur.execute("DELETE FROM dim_times;")
+            cur.execute(time_table_insert)
+            conn.commit()
+            print("✅ Loaded dim_users and rebuilt dim_times from fact_songplays")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import configparser
+import time
+
+import pandas as pd
+import psycopg2
+
+from partitions import FACT_PARTITIONED, list_partitions, partition_name
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+# Thresholds (in percent) past which a table is maintained, and the time budget in seconds
+UNSORTED_PCT = config.getfloat('MAINTENANCE', 'UNSORTED_PCT', fallback=10.0)
+DELETED_PCT = config.getfloat('MAINTENANCE', 'DELETED_PCT', fallback=10.0)
+STATS_OFF_PCT = config.getfloat('MAINTENANCE', 'STATS_OFF_PCT', fallback=10.0)
+TIME_BUDGET = config.getfloat('MAINTENANCE', 'TIME_BUDGET', fallback=1800.0)
+
+maintained_tables = ["fact_songplays", "dim_users", "dim_songs", "dim_artists", "dim_times"]
+
+table_info_query = """
+    SELECT "table",
+           COALESCE(unsorted, 0) AS unsorted,
+           COALESCE(stats_off, 0) AS stats_off,
+           tbl_rows,
+           CASE WHEN tbl_rows > 0
+                THEN 100.0 * (tbl_rows - estimated_visible_rows) / tbl_rows
+                ELSE 0
+           END AS deleted
+    FROM svv_table_info
+    WHERE schema = 'public'
+    AND "table" IN %s;
+"""
+
+vacuum_progress_query = """
+    SELECT table_name, status
+    FROM svv_vacuum_progress;
+"""
+
+
+def vacuum_in_progress(cur):
+    """
+        Check whether a vacuum is currently running on the cluster.
+
+        Redshift runs one vacuum at a time, so no vacuum is scheduled while another
+        one (e.g. an automatic vacuum) is in progress.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            str: Name of the table being vacuumed, or None.
+    """
+    cur.execute(vacuum_progress_query)
+    for table_name, status in cur.fetchall():
+        status = status.strip()
+        if status not in ("Complete", "Failed") and not status.startswith("Skipped"):
+            return table_name.strip()
+    return None
+
+
+def plan_maintenance(table_info, vacuum_allowed=True):
+    """
+        Decide which maintenance commands each table needs.
+
+        Args:
+            table_info (pd.DataFrame): Rows of `table_info_query`.
+            vacuum_allowed (bool): Whether VACUUM may be scheduled.
+
+        Returns:
+            list: (table, command) tuples, most unsorted/stale tables first.
+    """
+    plan = []
+    table_info = table_info.sort_values(["unsorted", "deleted", "stats_off"], ascending=False)
+    for row in table_info.itertuples(index=False):
+        needs_sort = row.unsorted > UNSORTED_PCT
+        needs_delete = row.deleted > DELETED_PCT
+
+        if vacuum_allowed:
+            # Reclaim and re-sort in a single pass when both are needed
+            if needs_sort and needs_delete:
+                plan.append((row.table, f"VACUUM FULL {row.table};"))
+            elif needs_sort:
+                plan.append((row.table, f"VACUUM SORT ONLY {row.table};"))
+            elif needs_delete:
+                plan.append((row.table, f"VACUUM DELETE ONLY {row.table};"))
+
+        if row.stats_off > STATS_OFF_PCT:
+            plan.append((row.table, f"ANALYZE {row.table} PREDICATE COLUMNS;"))
+    return plan
+
+
+def run_maintenance(conn, tables=None, time_budget=TIME_BUDGET, dry_run=False):
+    """
+        Run VACUUM/ANALYZE on the tables that are past their thresholds.
+
+        Each command runs with a `statement_timeout` of the remaining time budget, so
+        the run ends once the budget is spent. Cancelled and not started commands are
+        reported as skipped and picked up by the next run.
+
+        Args:
+            conn (psycopg2.extensions.connection): Connection object, switched to autocommit
+                since VACUUM cannot run inside a transaction block.
+            tables (list, optional): Tables to consider. Defaults to `maintained_tables`, with
+                `fact_songplays` replaced by its monthly partitions when partitioned.
+            time_budget (float): Seconds after which running commands are cancelled and no
+                new command is started.
+            dry_run (bool): Only report the plan, don't run it.
+
+        Returns:
+            pd.DataFrame: Report with one row per planned command.
+    """
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    if tables is None:
+        tables = maintained_tables
+        if FACT_PARTITIONED:
+            tables = [t for t in tables if t != "fact_songplays"]
+            tables += [partition_name(year, month) for year, month in list_partitions(cur)]
+
+    cur.execute(table_info_query, (tuple(tables),))
+    col_names = [desc[0] for desc in cur.description]
+    table_info = pd.DataFrame(cur.fetchall(), columns=col_names)
+    table_info["table"] = table_info["table"].str.strip()
+    for column in ["unsorted", "stats_off", "deleted"]:
+        table_info[column] = table_info[column].astype(float)
+    print(table_info.to_string(index=False))
+
+    vacuuming = vacuum_in_progress(cur)
+    if vacuuming:
+        print(f"⚠️ Vacuum already running on {vacuuming} - only ANALYZE will be scheduled")
+
+    report = []
+    start_time = time.time()
+    for table, command in plan_maintenance(table_info, vacuum_allowed=vacuuming is None):
+        if dry_run:
+            report.append((table, command, "planned", 0.0))
+            continue
+        remaining = time_budget - (time.time() - start_time)
+        if remaining <= 0:
+            report.append((table, command, "skipped (time budget)", 0.0))
+            continue
+
+        # Cancel the command once the budget is spent; an interrupted VACUUM keeps the
+        # blocks it already sorted or reclaimed, and the next run picks up the rest
+        print(f"⏳ {command}")
+        cur.execute("SET statement_timeout TO {};".format(max(int(remaining * 1000), 1)))
+        command_start = time.time()
+        try:
+            cur.execute(command)
+            status = "done"
+        except psycopg2.errors.QueryCanceled:
+            status = "skipped (timed out)"
+            print(f"⚠️ {command} cancelled at the end of the time budget")
+        report.append((table, command, status, time.time() - command_start))
+
+    cur.execute("RESET statement_timeout;")
+    cur.close()
+    return pd.DataFrame(report, columns=["table", "command", "status", "duration"])
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tables", nargs="*", help="Tables to maintain (default: all analytical tables)")
+    parser.add_argument("--time-budget", type=float, default=TIME_BUDGET,
+                        help="Seconds after which commands are cancelled and no new one is started")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the maintenance plan")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+
+    report = run_maintenance(conn, args.tables or None, args.time_budget, args.dry_run)
+    if report.empty:
+        print("✅ All tables within thresholds - nothing to do.")
+    else:
+        print(report.to_string(index=False))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
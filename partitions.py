@@ -0,0 +1,358 @@
+import configparser
+import re
+from datetime import date, datetime, timezone
+
+import psycopg2
+
+from sql_queries import songplays_select
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+# When enabled, fact_songplays is a late-binding UNION ALL view over one table per month
+FACT_PARTITIONED = config.getboolean('PARTITIONING', 'ENABLED', fallback=False)
+RETENTION_MONTHS = config.getint('PARTITIONING', 'RETENTION_MONTHS', fallback=0)
+
+songplay_columns = ["songplay_id", "start_time", "user_id", "level", "song_id", "artist_id",
+                    "session_id", "location", "user_agent"]
+
+partition_pattern = re.compile(r"^fact_songplays_(\d{4})_(\d{2})$")
+
+# Same layout as songplay_table_create. Each partition seeds its IDENTITY from its month
+# so songplay_id stays unique across the view.
+partition_table_create = (
+    """
+        CREATE TABLE IF NOT EXISTS {name} (
+            songplay_id BIGINT IDENTITY({seed}, 1) PRIMARY KEY,
+            start_time timestamp NOT NULL SORTKEY, --sort on this column
+            user_id integer REFERENCES dim_users(user_id) NOT NULL,
+            level varchar(10) NOT NULL,
+            song_id varchar(50) REFERENCES dim_songs(song_id) NOT NULL,
+            artist_id varchar(50) REFERENCES dim_artists(artist_id) NOT NULL,
+            session_id integer NOT NULL,
+            location varchar(255) NOT NULL,
+            user_agent varchar(255) NOT NULL
+        )
+        DISTSTYLE AUTO;
+    """
+)
+
+# Months with song plays in staging
+staging_months_query = """
+    SELECT DISTINCT
+        EXTRACT(year FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS year,
+        EXTRACT(month FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS month
+    FROM staging_events
+    WHERE page = 'NextSong'
+    AND ts IS NOT NULL
+    ORDER BY year, month;
+"""
+
+
+def partition_name(year, month):
+    """
+        Name of the table holding the plays of a month, e.g. `fact_songplays_2018_11`.
+    """
+    return "fact_songplays_{:04d}_{:02d}".format(int(year), int(month))
+
+
+def month_bounds(year, month):
+    """
+        Half-open [start, end) range of a month.
+
+        Returns:
+            tuple: (start, end) as datetimes.
+    """
+    start = datetime(int(year), int(month), 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def list_partitions(cur):
+    """
+        List the existing monthly partitions.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            list: (year, month) tuples in chronological order.
+    """
+    cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE 'fact_songplays_%';")
+    partitions = []
+    for (tablename,) in cur.fetchall():
+        match = partition_pattern.match(tablename.strip())
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2))))
+    return sorted(partitions)
+
+
+def partitions_in_range(partitions, start, end):
+    """
+        Select the partitions a half-open [start, end) range touches.
+
+        Args:
+            partitions (list): (year, month) tuples.
+            start (date | datetime): Inclusive start of the range.
+            end (date | datetime): Exclusive end of the range.
+
+        Returns:
+            list: (year, month) tuples overlapping the range.
+    """
+    start = datetime(start.year, start.month, start.day) if type(start) is date else start
+    end = datetime(end.year, end.month, end.day) if type(end) is date else end
+    selected = []
+    for year, month in partitions:
+        month_start, month_end = month_bounds(year, month)
+        if month_start < end and start < month_end:
+            selected.append((year, month))
+    return selected
+
+
+def union_all(partitions):
+    """
+        Build a UNION ALL over the given partitions.
+
+        Tables are schema qualified as required by late-binding views. With no
+        partitions, an empty result with the fact table's columns is returned.
+
+        Args:
+            partitions (list): (year, month) tuples.
+
+        Returns:
+            str: SELECT statement.
+    """
+    columns = ", ".join(songplay_columns)
+    if not partitions:
+        return ("SELECT NULL::bigint AS songplay_id, NULL::timestamp AS start_time, NULL::integer AS user_id, "
+                "NULL::varchar(10) AS level, NULL::varchar(50) AS song_id, NULL::varchar(50) AS artist_id, "
+                "NULL::integer AS session_id, NULL::varchar(255) AS location, NULL::varchar(255) AS user_agent "
+                "WHERE 1 = 0")
+    return "\nUNION ALL\n".join("SELECT {} FROM public.{}".format(columns, partition_name(year, month))
+                                for year, month in partitions)
+
+
+def partitioned_source(cur, start, end):
+    """
+        Build a derived table reading only the partitions a range touches.
+
+        Used in place of `fact_songplays` in queries so the partitions outside the
+        range are not scanned at all.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            start (date | datetime): Inclusive start of the range.
+            end (date | datetime): Exclusive end of the range.
+
+        Returns:
+            tuple: (derived table SQL, list of (year, month) partitions read)
+    """
+    partitions = partitions_in_range(list_partitions(cur), start, end)
+    return "({})".format(union_all(partitions)), partitions
+
+
+def refresh_view(cur, partitions=None):
+    """
+        Recreate the `fact_songplays` view over the existing partitions.
+
+        The view is late-binding (WITH NO SCHEMA BINDING), so partitions can be
+        swapped or dropped without dropping the view first. It only needs to be
+        refreshed when the set of partitions changes.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            partitions (list, optional): (year, month) tuples. Listed from the database if None.
+    """
+    if partitions is None:
+        partitions = list_partitions(cur)
+    cur.execute("DROP VIEW IF EXISTS fact_songplays;")
+    cur.execute("CREATE VIEW fact_songplays AS\n{}\nWITH NO SCHEMA BINDING;".format(union_all(partitions)))
+
+
+def ensure_partition(cur, year, month):
+    """
+        Create the partition of a month and add it to the view if it doesn't exist.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            year (int): Year of the partition.
+            month (int): Month of the partition.
+
+        Returns:
+            str: Name of the partition.
+    """
+    name = partition_name(year, month)
+    if (int(year), int(month)) not in list_partitions(cur):
+        cur.execute(partition_table_create.format(name=name, seed=(int(year) * 100 + int(month)) * 10 ** 9))
+        refresh_view(cur)
+    return name
+
+
+def load_partition(cur, year, month):
+    """
+        Rebuild the partition of a month from staging and swap it in.
+
+        The month is loaded into a new table which then replaces the old partition
+        by renaming, so readers of the view never see a half-loaded month. Runs in
+        the caller's transaction; commit to publish the swap.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            year (int): Year of the partition.
+            month (int): Month of the partition.
+
+        Returns:
+            str: Name of the partition.
+    """
+    name = partition_name(year, month)
+    new_name = name + "_new"
+    start, end = month_bounds(year, month)
+    start_ms = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    end_ms = int(end.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    is_new = (int(year), int(month)) not in list_partitions(cur)
+
+    cur.execute("DROP TABLE IF EXISTS {};".format(new_name))
+    cur.execute(partition_table_create.format(name=new_name, seed=(int(year) * 100 + int(month)) * 10 ** 9))
+    cur.execute(
+        """
+        INSERT INTO {} (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+        {}
+        AND se.ts >= {} AND se.ts < {};
+        """.format(new_name, songplays_select.strip(), start_ms, end_ms)
+    )
+    cur.execute("DROP TABLE IF EXISTS {};".format(name))
+    cur.execute("ALTER TABLE {} RENAME TO {};".format(new_name, name))
+
+    if is_new:
+        refresh_view(cur)
+    return name
+
+
+def load_all_partitions(cur):
+    """
+        Rebuild the partition of every month found in staging.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            list: Names of the loaded partitions.
+    """
+    cur.execute(staging_months_query)
+    return [load_partition(cur, year, month) for year, month in cur.fetchall()]
+
+
+def drop_partition(cur, year, month):
+    """
+        Drop the partition of a month and remove it from the view.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            year (int): Year of the partition.
+            month (int): Month of the partition.
+    """
+    cur.execute("DROP TABLE IF EXISTS {};".format(partition_name(year, month)))
+    refresh_view(cur)
+
+
+def apply_retention(cur, keep_months=RETENTION_MONTHS):
+    """
+        Drop all but the `keep_months` most recent partitions.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            keep_months (int): Number of partitions to keep; 0 keeps everything.
+
+        Returns:
+            list: (year, month) tuples of the dropped partitions.
+    """
+    partitions = list_partitions(cur)
+    if keep_months <= 0 or len(partitions) <= keep_months:
+        return []
+
+    expired = partitions[:-keep_months]
+    for year, month in expired:
+        cur.execute("DROP TABLE IF EXISTS {};".format(partition_name(year, month)))
+    refresh_view(cur, partitions[-keep_months:])
+    return expired
+
+
+def load_fact_songplays(cur):
+    """
+        Rebuild the partitions found in staging, then drop the expired ones when
+        `RETENTION_MONTHS` is set.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            list: Names of the loaded partitions that were kept.
+    """
+    loaded = load_all_partitions(cur)
+    if RETENTION_MONTHS > 0:
+        expired = {partition_name(year, month) for year, month in apply_retention(cur)}
+        loaded = [name for name in loaded if name not in expired]
+    return loaded
+
+
+def drop_fact_songplays(cur):
+    """
+        Drop `fact_songplays` whether it is a table or the partitioned view, and
+        all monthly partitions.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+    """
+    cur.execute("SELECT table_type FROM information_schema.tables "
+                "WHERE table_schema = 'public' AND table_name = 'fact_songplays';")
+    row = cur.fetchone()
+    if row and row[0] == 'VIEW':
+        cur.execute("DROP VIEW fact_songplays;")
+    elif row:
+        cur.execute("DROP TABLE fact_songplays;")
+
+    for year, month in list_partitions(cur):
+        cur.execute("DROP TABLE IF EXISTS {};".format(partition_name(year, month)))
+
+
+def parse_month(value):
+    """
+        Parse a `YYYY-MM` command line argument into a (year, month) tuple.
+    """
+    parsed = datetime.strptime(value, "%Y-%m")
+    return parsed.year, parsed.month
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list", action="store_true", help="List the monthly partitions")
+    parser.add_argument("--load", type=parse_month, metavar="YYYY-MM", help="Reload a month from staging")
+    parser.add_argument("--drop", type=parse_month, metavar="YYYY-MM", help="Drop a month")
+    parser.add_argument("--retain", type=int, metavar="N", help="Keep only the N most recent months")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+    cur = conn.cursor()
+
+    if args.load:
+        print(f"✅ Loaded {load_partition(cur, *args.load)}")
+    if args.drop:
+        drop_partition(cur, *args.drop)
+        print(f"🗑️ Dropped {partition_name(*args.drop)}")
+    if args.retain is not None:
+        for year, month in apply_retention(cur, args.retain):
+            print(f"🗑️ Dropped {partition_name(year, month)}")
+    conn.commit()
+
+    if args.list or not (args.load or args.drop or args.retain is not None):
+        for year, month in list_partitions(cur):
+            print(partition_name(year, month))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import configparser
+import hashlib
+import time
+from datetime import date, datetime
+
+import pandas as pd
+import psycopg2
+
+from partitions import FACT_PARTITIONED, partitioned_source
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+# Analytical query templates. Every template is restricted to a half-open `start_time` range
+# so Redshift can skip the blocks of `fact_songplays` outside it using the sort key.
+# {filters} is replaced by the optional level/location predicates, {limit} by the top-N clause
+# and {source} by `fact_songplays`, or by only the partitions in range when it is partitioned.
+query_templates = {
+    "top_songs": """
+        SELECT s.title, COUNT(*) AS play_count
+        FROM {source} sp
+        JOIN dim_songs s ON sp.song_id = s.song_id
+        WHERE sp.start_time >= $1 AND sp.start_time < $2{filters}
+        GROUP BY s.title
+        ORDER BY play_count DESC
+        {limit}
+    """,
+    "top_users": """
+        SELECT u.user_id, u.first_name, u.last_name, COUNT(*) AS play_count
+        FROM {source} sp
+        JOIN dim_users u ON u.user_id = sp.user_id
+        WHERE sp.start_time >= $1 AND sp.start_time < $2{filters}
+        GROUP BY u.user_id, u.first_name, u.last_name
+        ORDER BY play_count DESC
+        {limit}
+    """,
+    "top_artists": """
+        SELECT a.artist_name, COUNT(*) AS play_count
+        FROM {source} sp
+        JOIN dim_artists a ON sp.artist_id = a.artist_id
+        WHERE sp.start_time >= $1 AND sp.start_time < $2{filters}
+        GROUP BY a.artist_name
+        ORDER BY play_count DESC
+        {limit}
+    """,
+    "top_locations": """
+        SELECT sp.location, COUNT(*) AS play_count
+        FROM {source} sp
+        WHERE sp.start_time >= $1 AND sp.start_time < $2{filters}
+        GROUP BY sp.location
+        ORDER BY play_count DESC
+        {limit}
+    """,
+    "plays_by_weekday": """
+        SELECT t.weekday, TRIM(TO_CHAR(t.start_time, 'Day')) AS weekday_name, COUNT(*) AS play_count
+        FROM {source} sp
+        JOIN dim_times t ON sp.start_time = t.start_time
+        WHERE sp.start_time >= $1 AND sp.start_time < $2{filters}
+        GROUP BY t.weekday, weekday_name
+        ORDER BY t.weekday
+        {limit}
+    """
+}
+
+# Optional filters: name -> (column, server-side type)
+query_filters = {
+    "level": ("sp.level", "varchar(10)"),
+    "location": ("sp.location", "varchar(255)")
+}
+
+levels = ("free", "paid")
+
+
+def to_datetime(value):
+    """
+        Normalise a date to midnight of that day so dates and datetimes compare.
+    """
+    return datetime(value.year, value.month, value.day) if type(value) is date else value
+
+
+def validate_params(start, end, top_n=None, level=None, location=None):
+    """
+        Check the types and values of the query parameters.
+
+        Args:
+            start (date | datetime): Inclusive start of the `start_time` range.
+            end (date | datetime): Exclusive end of the `start_time` range.
+            top_n (int, optional): Number of rows to return.
+            level (str, optional): Subscription level, 'free' or 'paid'.
+            location (str, optional): Exact user location.
+
+        Raises:
+            TypeError: If a parameter has the wrong type.
+            ValueError: If a parameter has an invalid value.
+    """
+    for name, value in (("start", start), ("end", end)):
+        if not isinstance(value, (date, datetime)):
+            raise TypeError(f"{name} must be a date or datetime, got {type(value).__name__}")
+    if to_datetime(start) >= to_datetime(end):
+        raise ValueError("start must be before end")
+    if top_n is not None and (not isinstance(top_n, int) or isinstance(top_n, bool) or top_n < 1):
+        raise ValueError("top_n must be a positive integer")
+    if level is not None and level not in levels:
+        raise ValueError(f"level must be one of {levels}")
+    if location is not None and not isinstance(location, str):
+        raise TypeError(f"location must be a string, got {type(location).__name__}")
+
+
+def compile_query(name, top_n=None, filters=(), source="fact_songplays"):
+    """
+        Compile a template into a statement with positional parameters.
+
+        Args:
+            name (str): Key of `query_templates`.
+            top_n (int, optional): Number of rows to return; no LIMIT if None.
+            filters (tuple): Names of the optional filters from `query_filters` in use.
+            source (str): Table or derived table to read the song plays from.
+
+        Returns:
+            tuple: (statement, parameter types in order)
+    """
+    param_types = ["timestamp", "timestamp"]
+    predicates = ""
+    for filter_name in filters:
+        column, param_type = query_filters[filter_name]
+        param_types.append(param_type)
+        predicates += f"\n        AND {column} = ${len(param_types)}"
+
+    limit = f"LIMIT {top_n}" if top_n else ""
+    statement = query_templates[name].format(source=source, filters=predicates, limit=limit).strip()
+    return statement, param_types
+
+
+class QueryAPI:
+    """
+        Runs the analytical query templates as server-side prepared statements.
+
+        Each variant (template, top-N, filters in use) is prepared once per connection
+        with PREPARE and executed with EXECUTE afterwards, so repeated dashboard calls
+        skip parsing and planning. When `fact_songplays` is partitioned, the set of
+        partitions the date range touches is part of the variant.
+    """
+
+    def __init__(self, conn):
+        """
+            Args:
+                conn (psycopg2.extensions.connection): Connection the statements are prepared on.
+        """
+        # Prepared statements live for the session, so every EXECUTE can run in its own
+        # transaction: each call sees the latest loads and holds no locks afterwards
+        conn.autocommit = True
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.prepared = {}
+
+    def prepare(self, name, top_n=None, filters=(), source="fact_songplays", partitions=None):
+        """
+            Prepare a query variant on the connection if not already prepared.
+
+            Args:
+                name (str): Key of `query_templates`.
+                top_n (int, optional): Number of rows to return.
+                filters (tuple): Names of the optional filters in use.
+                source (str): Table or derived table to read the song plays from.
+                partitions (tuple, optional): Partitions `source` reads, when partitioned.
+
+            Returns:
+                str: Name of the prepared statement.
+        """
+        key = (name, top_n, filters, partitions)
+        if key not in self.prepared:
+            statement, param_types = compile_query(name, top_n, filters, source)
+            statement_name = "{}_{}".format(name, hashlib.md5(repr(key).encode()).hexdigest()[:8])
+            self.cur.execute("PREPARE {} ({}) AS {};".format(statement_name, ", ".join(param_types), statement))
+            self.prepared[key] = statement_name
+        return self.prepared[key]
+
+    def run(self, name, start, end, top_n=10, level=None, location=None):
+        """
+            Run a query template for a time range.
+
+            Args:
+                name (str): Key of `query_templates`.
+                start (date | datetime): Inclusive start of the `start_time` range.
+                end (date | datetime): Exclusive end of the `start_time` range.
+                top_n (int, optional): Number of rows to return; None for all rows.
+                level (str, optional): Only count plays at this subscription level.
+                location (str, optional): Only count plays from this location.
+
+            Returns:
+                pd.DataFrame: Query result.
+        """
+        if name not in query_templates:
+            raise ValueError(f"unknown query {name!r}, expected one of {list(query_templates)}")
+        validate_params(start, end, top_n, level, location)
+        start, end = to_datetime(start), to_datetime(end)
+
+        filter_values = {"level": level, "location": location}
+        filters = tuple(f for f in query_filters if filter_values[f] is not None)
+        params = [start, end] + [filter_values[f] for f in filters]
+
+        source, partitions = "fact_songplays", None
+        if FACT_PARTITIONED:
+            source, partitions = partitioned_source(self.cur, start, end)
+            partitions = tuple(partitions)
+
+        statement_name = self.prepare(name, top_n, filters, source, partitions)
+        self.cur.execute("EXECUTE {} ({});".format(statement_name, ", ".join(["%s"] * len(params))), params)
+        col_names = [desc[0] for desc in self.cur.description]
+        return pd.DataFrame(self.cur.fetchall(), columns=col_names)
+
+    def close(self):
+        """
+            Deallocate the prepared statements and close the cursor.
+        """
+        for statement_name in self.prepared.values():
+            self.cur.execute(f"DEALLOCATE {statement_name};")
+        self.prepared = {}
+        self.cur.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", choices=list(query_templates), help="Query template to run")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="Start date (inclusive), YYYY-MM-DD")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="End date (exclusive), YYYY-MM-DD")
+    parser.add_argument("--top", type=int, default=10, help="Number of rows to return")
+    parser.add_argument("--level", choices=levels, help="Only count plays at this level")
+    parser.add_argument("--location", help="Only count plays from this location")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+    api = QueryAPI(conn)
+
+    # Run twice to show the saving once the statement is prepared
+    for attempt in ("first run", "prepared"):
+        start_time = time.time()
+        df = api.run(args.query, args.start, args.end, args.top, args.level, args.location)
+        print(f"⏱️ Query time ({attempt}): {time.time() - start_time:.4f} seconds")
+    print(df)
+
+    api.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import configparser
+import hashlib
+from datetime import datetime
+from urllib.parse import urlparse
+
+import boto3
+
+from partitions import FACT_PARTITIONED, RETENTION_MONTHS, load_fact_songplays, partition_table_create
+from sql_queries import (LOG_DATA, LOG_JSONPATH, SONG_DATA, STREAM_DATA, etl_run_state_table_create,
+                         staging_events_copy, staging_songs_copy, songplays_table_insert,
+                         user_table_insert, song_table_insert, artist_table_insert,
+                         time_table_insert, songplays_select)
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+# ETL steps in execution order. A step is re-run when it has no completed state or when its
+# fingerprint changed. The fingerprint covers the step's SQL, its S3 inputs and the fingerprints
+# of the steps it depends on, so re-loading a step invalidates everything downstream of it.
+# Steps with a "run" callable load their table themselves instead of running "query"; their
+# "fingerprint_source" stands in for the SQL in the fingerprint.
+etl_steps = [
+    {"name": "staging_events", "query": staging_events_copy, "table": "staging_events",
+     "inputs": [LOG_DATA, LOG_JSONPATH] + ([STREAM_DATA] if STREAM_DATA else []), "depends_on": []},
+    {"name": "staging_songs", "query": staging_songs_copy, "table": "staging_songs",
+     "inputs": [SONG_DATA], "depends_on": []},
+    {"name": "fact_songplays", "query": songplays_table_insert, "table": "fact_songplays",
+     "inputs": [], "depends_on": ["staging_events", "staging_songs"]},
+    {"name": "dim_users", "query": user_table_insert, "table": "dim_users",
+     "inputs": [], "depends_on": ["staging_events"]},
+    {"name": "dim_songs", "query": song_table_insert, "table": "dim_songs",
+     "inputs": [], "depends_on": ["staging_songs"]},
+    {"name": "dim_artists", "query": artist_table_insert, "table": "dim_artists",
+     "inputs": [], "depends_on": ["staging_songs"]},
+    {"name": "dim_times", "query": time_table_insert, "table": "dim_times",
+     "inputs": [], "depends_on": ["fact_songplays"]}
+]
+
+if FACT_PARTITIONED:
+    # Each month is rebuilt and swapped in, so the view is never emptied with DELETE, and
+    # the partitions past RETENTION_MONTHS are dropped in the same transaction
+    etl_steps[2] = {"name": "fact_songplays", "run": load_fact_songplays,
+                    "fingerprint_source": partition_table_create + songplays_select
+                    + "\nRETENTION_MONTHS={}".format(RETENTION_MONTHS),
+                    "table": "fact_songplays",
+                    "inputs": [], "depends_on": ["staging_events", "staging_songs"]}
+
+
+def s3_fingerprint(s3, uri):
+    """
+        Hash the key, ETag and size of every object under an S3 prefix.
+
+        The hash changes whenever a file is added, removed or rewritten, without
+        downloading any data. A manifest file is fingerprinted the same way.
+
+        Args:
+            s3 (boto3.client): S3 client.
+            uri (str): S3 prefix or object URI.
+
+        Returns:
+            str: Hex digest of the listing.
+    """
+    url = urlparse(uri)
+    digest = hashlib.sha256()
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=url.netloc, Prefix=url.path.lstrip('/')):
+        for obj in page.get('Contents', []):
+            digest.update("{}|{}|{}\n".format(obj['Key'], obj['ETag'], obj['Size']).encode())
+    return digest.hexdigest()
+
+
+def step_fingerprint(step, s3, upstream):
+    """
+        Fingerprint a step from its SQL, its S3 inputs and the steps it depends on.
+
+        Args:
+            step (dict): Step from `etl_steps`.
+            s3 (boto3.client): S3 client.
+            upstream (dict): Step name -> fingerprint of the steps already fingerprinted.
+
+        Returns:
+            str: Hex digest identifying the step's inputs.
+    """
+    digest = hashlib.sha256(step.get("fingerprint_source", step.get("query", "")).encode())
+    for uri in step["inputs"]:
+        digest.update(s3_fingerprint(s3, uri).encode())
+    for dep in step["depends_on"]:
+        digest.update("{}={}\n".format(dep, upstream[dep]).encode())
+    return digest.hexdigest()
+
+
+def load_run_state(cur):
+    """
+        Read the recorded state of every step.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            dict: Step name -> (status, fingerprint).
+    """
+    cur.execute("SELECT step_name, status, fingerprint FROM etl_run_state;")
+    return {name: (status, fingerprint) for name, status, fingerprint in cur.fetchall()}
+
+
+def record_step(cur, name, status, fingerprint, row_count, started_at):
+    """
+        Replace the recorded state of a step.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            name (str): Step name.
+            status (str): 'done' or 'failed'.
+            fingerprint (str): Step fingerprint.
+            row_count (int): Rows in the step's table after it ran, None if it failed.
+            started_at (datetime): When the step started.
+    """
+    cur.execute("DELETE FROM etl_run_state WHERE step_name = %s;", (name,))
+    cur.execute(
+        """
+        INSERT INTO etl_run_state (step_name, status, fingerprint, row_count, started_at, finished_at)
+        VALUES (%s, %s, %s, %s, %s, %s);
+        """,
+        (name, status, fingerprint, row_count, started_at, datetime.utcnow())
+    )
+
+
+def run_step(cur, conn, step, fingerprint):
+    """
+        Run a single step and record its state.
+
+        The step's table is emptied and reloaded in the same transaction as its state
+        row, so a re-run never appends duplicates and a crash never leaves a step
+        marked done with partial output.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            step (dict): Step from `etl_steps`.
+            fingerprint (str): Step fingerprint.
+
+        Returns:
+            int: Rows in the step's table after loading.
+    """
+    started_at = datetime.utcnow()
+    try:
+        if "run" in step:
+            step["run"](cur)
+        else:
+            cur.execute("DELETE FROM {};".format(step["table"]))
+            cur.execute(step["query"])
+        cur.execute("SELECT COUNT(*) FROM {};".format(step["table"]))
+        row_count = cur.fetchone()[0]
+        record_step(cur, step["name"], "done", fingerprint, row_count, started_at)
+        conn.commit()
+        return row_count
+    except Exception:
+        # Recording the failure is best effort: if the connection itself is gone it fails
+        # too, and the original error is the one worth raising
+        try:
+            conn.rollback()
+            record_step(cur, step["name"], "failed", fingerprint, None, started_at)
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️ Could not record the failure of {step['name']}: {e}")
+        raise
+
+
+def run_steps(cur, conn, steps=None, resume=False):
+    """
+        Run the ETL steps, optionally skipping the ones that are already done.
+
+        With `resume`, a step is skipped when its recorded state is 'done' with the
+        same fingerprint. Since the fingerprint includes those of the steps it depends
+        on, a step built from since re-loaded upstream data is re-run.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            steps (list, optional): Steps to run. Defaults to `etl_steps`.
+            resume (bool): Skip steps that are already done and still valid.
+    """
+    if steps is None:
+        steps = etl_steps
+
+    cur.execute(etl_run_state_table_create)
+    conn.commit()
+    state = load_run_state(cur) if resume else {}
+
+    s3 = boto3.client('s3',
+                      aws_access_key_id=config.get('AWS', 'KEY'),
+                      aws_secret_access_key=config.get('AWS', 'SECRET'))
+
+    fingerprints = {}
+    for step in steps:
+        fingerprint = step_fingerprint(step, s3, fingerprints)
+        fingerprints[step["name"]] = fingerprint
+
+        if state.get(step["name"]) == ("done", fingerprint):
+            print(f"⏭️ Skipping {step['name']} (already done)")
+            continue
+
+        print(f"⏳ Running {step['name']}...")
+        row_count = run_step(cur, conn, step, fingerprint)
+        print(f"✅ {step['name']}: {row_count} rows")
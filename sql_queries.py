@@ -6,6 +6,18 @@ config = configparser.ConfigParser()
 config.read('dwh.cfg')
 DWH_ROLE_ARN = config.get('IAM_ROLE', 'ARN')
 
+# Source data read by the COPY commands
+LOG_DATA = config.get('S3', 'LOG_DATA', fallback='s3://udacity-dend/log_data').strip("'")
+LOG_JSONPATH = config.get('S3', 'LOG_JSONPATH', fallback='s3://udacity-dend/log_json_path.json').strip("'")
+SONG_DATA = config.get('S3', 'SONG_DATA', fallback='s3://udacity-dend/song_data').strip("'")
+
+# Event files tailed by streaming.py. They are staged along with LOG_DATA, so the nightly rebuild
+# of fact_songplays keeps the plays streamed during the day. Local directories cannot be copied
+# by Redshift, and a source under LOG_DATA is already covered by its COPY.
+STREAM_DATA = config.get('STREAMING', 'SOURCE', fallback='').strip("'")
+if not STREAM_DATA.startswith('s3://') or STREAM_DATA.startswith(LOG_DATA.rstrip('/') + '/'):
+    STREAM_DATA = ''
+
 # DROP TABLES
 
 staging_events_table_drop = "DROP TABLE IF EXISTS staging_events"
@@ -15,6 +27,8 @@ user_table_drop = "DROP TABLE IF EXISTS dim_users"
 song_table_drop = "DROP TABLE IF EXISTS dim_songs"
 artist_table_drop = "DROP TABLE IF EXISTS dim_artists"
 time_table_drop = "DROP TABLE IF EXISTS dim_times"
+etl_run_state_table_drop = "DROP TABLE IF EXISTS etl_run_state"
+streaming_progress_table_drop = "DROP TABLE IF EXISTS streaming_progress"
 
 # CREATE TABLES
 
@@ -133,39 +147,66 @@ time_table_create = (
     """
 )
 
+etl_run_state_table_create = (
+    """
+        CREATE TABLE IF NOT EXISTS etl_run_state (
+            step_name varchar(50) NOT NULL SORTKEY,
+            status varchar(10) NOT NULL,        -- 'done' or 'failed'
+            fingerprint varchar(64) NOT NULL,   -- hash of the step's SQL and its S3 inputs
+            row_count bigint,
+            started_at timestamp NOT NULL,
+            finished_at timestamp NOT NULL
+        )
+        DISTSTYLE ALL;   -- one row per ETL step
+    """
+)
+
+# Plain DDL so the streaming mode also runs against a local Postgres
+streaming_progress_table_create = (
+    """
+        CREATE TABLE IF NOT EXISTS streaming_progress (
+            file_key varchar(1024) NOT NULL,    -- local path or S3 key of an event file
+            line_offset integer NOT NULL,       -- lines of the file already loaded
+            complete boolean NOT NULL,
+            updated_at timestamp NOT NULL
+        );
+    """
+)
+
 # STAGING TABLES
 staging_events_copy = (
     """
-    COPY staging_events FROM 's3://udacity-dend/log_data'
+    COPY staging_events FROM '{}'
     IAM_ROLE {}
     REGION 'us-west-2'
-    FORMAT AS JSON 's3://udacity-dend/log_json_path.json'
+    FORMAT AS JSON '{}'
+    """
+).format(LOG_DATA, DWH_ROLE_ARN, LOG_JSONPATH)
+
+# The streaming bucket lives in the cluster's region, so no REGION is given
+if STREAM_DATA:
+    staging_events_copy += (
+        """;
+    COPY staging_events FROM '{}'
+    IAM_ROLE {}
+    FORMAT AS JSON '{}'
     """
-).format(DWH_ROLE_ARN)
+    ).format(STREAM_DATA, DWH_ROLE_ARN, LOG_JSONPATH)
 
 staging_songs_copy = (
     """
-    COPY staging_songs FROM 's3://udacity-dend/song_data'
+    COPY staging_songs FROM '{}'
     IAM_ROLE {}
     REGION 'us-west-2'
     FORMAT AS JSON 'auto'
     """
-).format(DWH_ROLE_ARN)
+).format(SONG_DATA, DWH_ROLE_ARN)
 
 # FINAL TABLES
 
-songplays_table_insert = (
+# Shared by the single-table load below and the per-month partition loads in partitions.py
+songplays_select = (
     """
-        INSERT INTO fact_songplays (
-            start_time,
-            user_id,
-            level,
-            song_id,
-            artist_id,
-            session_id,
-            location,
-            user_agent
-        )
         SELECT
             TIMESTAMP 'epoch' + se.ts/1000 * INTERVAL '1 second' AS start_time,
             se.user_id,
@@ -180,32 +221,77 @@ songplays_table_insert = (
         ON se.song = ss.title
         AND se.artist = ss.artist_name
         WHERE se.page = 'NextSong'
-        AND se.user_id IS NOT NULL;
+        AND se.user_id IS NOT NULL
+    """
+)
+
+songplays_table_insert = (
     """
+        INSERT INTO fact_songplays (
+            start_time,
+            user_id,
+            level,
+            song_id,
+            artist_id,
+            session_id,
+            location,
+            user_agent
+        )
+    """ + songplays_select.rstrip() + ";"
 )
 # The ABS(ss.length - ss.duration ) < 2.0 is used to handle minor inconsistencies in duration between
 # logs and metadata
 
-user_table_insert = (
+
+def latest_record_insert(table, columns, source, partition_key, order_by, where="TRUE", select=None):
     """
-        INSERT INTO dim_users (
-            user_id, 
-            first_name, 
-            last_name, 
-            gender, 
-            level
-        )
-        SELECT
-            distinct(user_id),
-            first_name,
-            last_name,
-            gender,
-            level
-        FROM staging_events 
-        WHERE user_id IS NOT NULL
-        AND page = 'NextSong'           --ensure only users who played songs are stored
-        ORDER BY user_id, ts DESC;      --pick the latest user record per user_id
+        Build an INSERT that keeps exactly one row per key from a source table.
+
+        Rows are ranked with ROW_NUMBER() OVER (PARTITION BY key ORDER BY ...) and only
+        the first row of each partition is inserted, so e.g. the most recent record of
+        a user wins instead of an arbitrary one.
+
+        Args:
+            table (str): Target table.
+            columns (list): Target columns, in insert order.
+            source (str): Source table.
+            partition_key (str): Column identifying a record in the source.
+            order_by (str): Ordering within a partition; the first row is kept.
+            where (str): Filter applied to the source before ranking.
+            select (list, optional): Source expressions for each target column.
+                Defaults to `columns`.
+
+        Returns:
+            str: The INSERT statement.
     """
+    select = select or columns
+    ranked = ",\n                ".join(
+        "{} AS {}".format(expr, col) if expr != col else col for expr, col in zip(select, columns))
+    return (
+        """
+        INSERT INTO {table} ({columns})
+        SELECT {columns}
+        FROM (
+            SELECT
+                {ranked},
+                ROW_NUMBER() OVER (PARTITION BY {partition_key} ORDER BY {order_by}) AS row_num
+            FROM {source}
+            WHERE {where}
+        ) ranked
+        WHERE row_num = 1;
+        """
+    ).format(table=table, columns=", ".join(columns), ranked=ranked, partition_key=partition_key,
+             order_by=order_by, source=source, where=where)
+
+
+# pick the latest record per user_id so a level change doesn't produce duplicate users
+user_table_insert = latest_record_insert(
+    table="dim_users",
+    columns=["user_id", "first_name", "last_name", "gender", "level"],
+    source="staging_events",
+    partition_key="user_id",
+    order_by="ts DESC",
+    where="user_id IS NOT NULL AND page = 'NextSong'"  # ensure only users who played songs are stored
 )
 
 song_table_insert = (
@@ -228,26 +314,20 @@ song_table_insert = (
     """
 )
 
-artist_table_insert = (
-    """
-        INSERT INTO dim_artists (
-            artist_id,
-            artist_name,
-            artist_location,
-            latitude,
-            longitude
-        )
-        SELECT 
-            distinct(artist_id),
-            artist_name,
-            artist_location,
-            artist_latitude as latitude,
-            artist_longitude as longitude
-        FROM staging_songs
-        WHERE artist_id IS NOT NULL
-    """
+# staging_songs holds one row per song, so pick one row per artist (from their most recent song).
+# Redshift sorts NULLs as the largest value, so undated songs would otherwise come first
+artist_table_insert = latest_record_insert(
+    table="dim_artists",
+    columns=["artist_id", "artist_name", "artist_location", "latitude", "longitude"],
+    select=["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"],
+    source="staging_songs",
+    partition_key="artist_id",
+    order_by="year DESC NULLS LAST, song_id",
+    where="artist_id IS NOT NULL"
 )
 
+# Derived from the distinct start times in fact_songplays (loaded first), so timestamps are
+# computed once per play instead of seven times per staging event including non-NextSong pages
 time_table_insert = (
     """
         INSERT INTO dim_times (
@@ -259,16 +339,18 @@ time_table_insert = (
             year,
             weekday
         )
-        SELECT 
-            distinct (TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS start_time,
-            EXTRACT(hour FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS hour,
-            EXTRACT(day FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS day,
-            EXTRACT(week FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS week,
-            EXTRACT(month FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS month,
-            EXTRACT(year FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS year,
-            EXTRACT(dow FROM TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second') AS weekday
-        FROM staging_events
-        WHERE ts IS NOT NULL;
+        SELECT
+            start_time,
+            EXTRACT(hour FROM start_time) AS hour,
+            EXTRACT(day FROM start_time) AS day,
+            EXTRACT(week FROM start_time) AS week,
+            EXTRACT(month FROM start_time) AS month,
+            EXTRACT(year FROM start_time) AS year,
+            EXTRACT(dow FROM start_time) AS weekday
+        FROM (
+            SELECT DISTINCT start_time
+            FROM fact_songplays
+        ) play_times;
     """
 )
 
@@ -276,11 +358,13 @@ time_table_insert = (
 
 create_table_queries = [staging_events_table_create, staging_songs_table_create,
                         user_table_create, song_table_create, artist_table_create,
-                        time_table_create, songplay_table_create]
+                        time_table_create, songplay_table_create, etl_run_state_table_create,
+                        streaming_progress_table_create]
 
 drop_table_queries = [staging_events_table_drop, staging_songs_table_drop, songplay_table_drop,
                       user_table_drop,
-                      song_table_drop, artist_table_drop, time_table_drop]
+                      song_table_drop, artist_table_drop, time_table_drop, etl_run_state_table_drop,
+                      streaming_progress_table_drop]
 
 copy_table_queries = [staging_events_copy, staging_songs_copy]
 
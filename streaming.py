@@ -0,0 +1,477 @@
+import configparser
+import csv
+import gzip
+import io
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse
+
+import boto3
+import psycopg2
+from psycopg2.extras import execute_values
+
+from partitions import FACT_PARTITIONED, ensure_partition
+from sql_queries import streaming_progress_table_create
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+DWH_ROLE_ARN = config.get('IAM_ROLE', 'ARN')
+SOURCE = config.get('STREAMING', 'SOURCE', fallback='').strip("'")
+STAGING_PREFIX = config.get('STREAMING', 'STAGING_PREFIX', fallback='').strip("'")
+S3_ENDPOINT_URL = config.get('STREAMING', 'S3_ENDPOINT_URL', fallback='').strip("'") or None
+TARGET = config.get('STREAMING', 'TARGET', fallback='redshift')
+FLUSH_SECONDS = config.getfloat('STREAMING', 'FLUSH_SECONDS', fallback=60.0)
+FLUSH_ROWS = config.getint('STREAMING', 'FLUSH_ROWS', fallback=5000)
+POLL_SECONDS = config.getfloat('STREAMING', 'POLL_SECONDS', fallback=5.0)
+
+songplay_columns = ["start_time", "user_id", "level", "song_id", "artist_id",
+                    "session_id", "location", "user_agent"]
+user_columns = ["user_id", "first_name", "last_name", "gender", "level"]
+
+song_index_query = """
+    SELECT s.title, a.artist_name, s.song_id, s.artist_id
+    FROM dim_songs s
+    JOIN dim_artists a ON s.artist_id = a.artist_id;
+"""
+
+# Keep dim_times in step with the streamed plays; only the batch's time range is scanned
+# thanks to the start_time sort key
+time_batch_insert = """
+    INSERT INTO dim_times (start_time, hour, day, week, month, year, weekday)
+    SELECT
+        sp.start_time,
+        EXTRACT(hour FROM sp.start_time),
+        EXTRACT(day FROM sp.start_time),
+        EXTRACT(week FROM sp.start_time),
+        EXTRACT(month FROM sp.start_time),
+        EXTRACT(year FROM sp.start_time),
+        EXTRACT(dow FROM sp.start_time)
+    FROM (
+        SELECT DISTINCT start_time
+        FROM fact_songplays
+        WHERE start_time BETWEEN %s AND %s
+    ) sp
+    LEFT JOIN dim_times t ON sp.start_time = t.start_time
+    WHERE t.start_time IS NULL;
+"""
+
+
+# Users seen in a batch replace their dim_users row, so first-time users get one and a level
+# change shows up without waiting for the nightly rebuild
+user_batch_delete = "DELETE FROM dim_users WHERE user_id IN %s;"
+user_batch_insert = "INSERT INTO dim_users ({}) VALUES %s".format(", ".join(user_columns))
+
+
+def make_s3_client():
+    """
+        Create an S3 client, pointed at `S3_ENDPOINT_URL` when set (e.g. a moto server).
+
+        Returns:
+            boto3.client: S3 client.
+    """
+    return boto3.client('s3',
+                        endpoint_url=S3_ENDPOINT_URL,
+                        aws_access_key_id=config.get('AWS', 'KEY'),
+                        aws_secret_access_key=config.get('AWS', 'SECRET'))
+
+
+def load_song_index(cur):
+    """
+        Build an in-memory hash index of songs keyed on (title, artist name).
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+
+        Returns:
+            dict: (title, artist_name) -> (song_id, artist_id).
+    """
+    cur.execute(song_index_query)
+    return {(title, artist_name): (song_id, artist_id)
+            for title, artist_name, song_id, artist_id in cur.fetchall()}
+
+
+def poll_local(directory, skip):
+    """
+        Yield the event files in a local directory that are not in `skip`.
+
+        Args:
+            directory (str): Directory to watch, searched recursively.
+            skip (set): Paths already read or fully loaded; updated in place.
+
+        Yields:
+            tuple: (path, contents) of each new file.
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if path.endswith('.json') and path not in skip:
+                skip.add(path)
+                with open(path, 'rb') as f:
+                    yield path, f.read()
+
+
+def poll_s3(s3, uri, skip):
+    """
+        Yield the event files under an S3 prefix that are not in `skip`.
+
+        Args:
+            s3 (boto3.client): S3 client.
+            uri (str): S3 prefix to watch.
+            skip (set): Keys already read or fully loaded; updated in place.
+
+        Yields:
+            tuple: (key, contents) of each new object.
+    """
+    url = urlparse(uri)
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=url.netloc, Prefix=url.path.lstrip('/')):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('.json') and obj['Key'] not in skip:
+                skip.add(obj['Key'])
+                yield obj['Key'], s3.get_object(Bucket=url.netloc, Key=obj['Key'])['Body'].read()
+
+
+def poll(s3, source, skip):
+    """
+        Yield the new event files of a local directory or S3 prefix.
+    """
+    if source.startswith('s3://'):
+        return poll_s3(s3, source, skip)
+    return poll_local(source, skip)
+
+
+def load_progress(cur, conn):
+    """
+        Read how far each event file has been loaded.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+
+        Returns:
+            dict: File key -> (line_offset, complete).
+    """
+    cur.execute(streaming_progress_table_create)
+    conn.commit()
+    cur.execute("SELECT file_key, line_offset, complete FROM streaming_progress;")
+    return {key: (offset, complete) for key, offset, complete in cur.fetchall()}
+
+
+def save_progress(cur, progress):
+    """
+        Record the progress of the given files in the caller's transaction.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            progress (dict): File key -> (line_offset, complete).
+    """
+    for key, (offset, complete) in progress.items():
+        cur.execute("DELETE FROM streaming_progress WHERE file_key = %s;", (key,))
+        cur.execute("INSERT INTO streaming_progress (file_key, line_offset, complete, updated_at) "
+                    "VALUES (%s, %s, %s, %s);", (key, offset, complete, datetime.utcnow()))
+
+
+def skip_existing(cur, conn, s3, source):
+    """
+        Mark every file currently under `source` as loaded without loading it.
+
+        Used when starting the stream on a source whose files the nightly batch
+        has already loaded.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            s3 (boto3.client): S3 client.
+            source (str): Local directory or S3 prefix to watch.
+
+        Returns:
+            int: Number of files marked.
+    """
+    skip = {key for key, (_, complete) in load_progress(cur, conn).items() if complete}
+    progress = {key: (len(content.splitlines()), True) for key, content in poll(s3, source, skip)}
+    save_progress(cur, progress)
+    conn.commit()
+    return len(progress)
+
+
+def enrich_event(event, song_index):
+    """
+        Turn a NextSong log event into a `fact_songplays` row.
+
+        Mirrors `songplays_table_insert`: only NextSong events with a user and a
+        song/artist pair found in the index produce a row.
+
+        Args:
+            event (dict): Parsed log event.
+            song_index (dict): Index built by `load_song_index`.
+
+        Returns:
+            tuple: Row in `songplay_columns` order, or None if the event is skipped.
+    """
+    if event.get('page') != 'NextSong' or not event.get('userId'):
+        return None
+
+    match = song_index.get((event.get('song'), event.get('artist')))
+    if match is None:
+        return None
+
+    song_id, artist_id = match
+    start_time = datetime.utcfromtimestamp(event['ts'] / 1000)
+    return (start_time, int(event['userId']), event['level'], song_id, artist_id,
+            event['sessionId'], event['location'], event['userAgent'])
+
+
+def enrich_user(event):
+    """
+        Turn a NextSong log event into a `dim_users` row.
+
+        Mirrors the filter of `user_table_insert`: every NextSong event with a user
+        counts, whether or not its song is matched.
+
+        Args:
+            event (dict): Parsed log event.
+
+        Returns:
+            tuple: Row in `user_columns` order, or None if the event is skipped.
+    """
+    if event.get('page') != 'NextSong' or not event.get('userId'):
+        return None
+    return (int(event['userId']), event.get('firstName'), event.get('lastName'),
+            event.get('gender'), event['level'])
+
+
+def encode_batch(rows):
+    """
+        Encode rows as a gzip compressed CSV file.
+
+        Args:
+            rows (list): Rows in `songplay_columns` order.
+
+        Returns:
+            bytes: Gzip compressed CSV.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        for row in rows:
+            writer.writerow([value.isoformat(sep=' ') if isinstance(value, datetime) else value
+                             for value in row])
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+def copy_batch_redshift(cur, s3, data, table="fact_songplays"):
+    """
+        Stage a micro-batch in S3 and COPY it into `fact_songplays`.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            s3 (boto3.client): S3 client.
+            data (bytes): Gzip compressed CSV.
+            table (str): Table to copy into, a monthly partition when partitioned.
+    """
+    url = urlparse(STAGING_PREFIX)
+    key = "{}/{}.csv.gz".format(url.path.strip('/'), uuid.uuid4().hex)
+    s3.put_object(Bucket=url.netloc, Key=key, Body=data)
+    cur.execute(
+        """
+        COPY {} ({})
+        FROM 's3://{}/{}'
+        IAM_ROLE {}
+        CSV GZIP
+        TIMEFORMAT 'auto';
+        """.format(table, ", ".join(songplay_columns), url.netloc, key, DWH_ROLE_ARN)
+    )
+
+
+def copy_batch_postgres(cur, data, table="fact_songplays"):
+    """
+        COPY a micro-batch into `fact_songplays` over the client connection.
+
+        Used against a local Postgres, which cannot COPY from S3.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            data (bytes): Gzip compressed CSV.
+            table (str): Table to copy into, a monthly partition when partitioned.
+    """
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as gz:
+        cur.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)"
+                        .format(table, ", ".join(songplay_columns)), gz)
+
+
+def flush(cur, conn, s3, rows, progress, target=TARGET, users=None):
+    """
+        Bulk load buffered rows, the dim_times entries for their time range and
+        the users seen in the batch.
+
+        The progress of the files the rows came from is recorded in the same
+        transaction, so after a crash every line is loaded exactly once.
+
+        When `fact_songplays` is partitioned, the rows are split by month and each
+        month is copied into its partition, which is created if needed.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            s3 (boto3.client): S3 client.
+            rows (list): Rows in `songplay_columns` order.
+            progress (dict): File key -> (line_offset, complete) covered by `rows`.
+            target (str): 'redshift' to COPY via S3, 'postgres' to COPY from STDIN.
+            users (dict, optional): User id -> latest row in `user_columns` order.
+    """
+    if users:
+        cur.execute(user_batch_delete, (tuple(users),))
+        execute_values(cur, user_batch_insert, list(users.values()))
+
+    if not rows:
+        save_progress(cur, progress)
+        conn.commit()
+        return
+
+    batches = {"fact_songplays": rows}
+    if FACT_PARTITIONED:
+        months = {}
+        for row in rows:
+            months.setdefault((row[0].year, row[0].month), []).append(row)
+        batches = {ensure_partition(cur, year, month): month_rows
+                   for (year, month), month_rows in months.items()}
+
+    for table, table_rows in batches.items():
+        data = encode_batch(table_rows)
+        if target == 'postgres':
+            copy_batch_postgres(cur, data, table)
+        else:
+            copy_batch_redshift(cur, s3, data, table)
+
+    start_times = [row[0] for row in rows]
+    cur.execute(time_batch_insert, (min(start_times), max(start_times)))
+    save_progress(cur, progress)
+    conn.commit()
+
+
+def stream(cur, conn, source=SOURCE, flush_seconds=FLUSH_SECONDS, flush_rows=FLUSH_ROWS,
+           poll_seconds=POLL_SECONDS, target=TARGET, max_polls=None):
+    """
+        Tail new event files and load NextSong plays in micro-batches.
+
+        A batch is flushed once it holds `flush_rows` rows or its oldest row is
+        `flush_seconds` old, whichever comes first. Files already loaded, as recorded
+        in `streaming_progress`, are skipped and partially loaded files are resumed
+        after their last loaded line.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            source (str): Local directory or S3 prefix to watch.
+            flush_seconds (float): Maximum age of a batch before it is flushed.
+            flush_rows (int): Maximum number of rows in a batch.
+            poll_seconds (float): Interval between polls of the source.
+            target (str): 'redshift' or 'postgres'.
+            max_polls (int, optional): Stop after this many polls (runs forever if None).
+
+        Returns:
+            int: Number of rows loaded.
+    """
+    s3 = make_s3_client()
+    print("⏳ Loading song index...")
+    song_index = load_song_index(cur)
+    print(f"✅ Indexed {len(song_index)} songs")
+
+    loaded_progress = load_progress(cur, conn)
+    skip = {key for key, (_, complete) in loaded_progress.items() if complete}
+    rows = []
+    users = {}
+    # Timestamp of the latest event per user, so a file read out of order never
+    # overwrites a newer dim_users row
+    latest_ts = {}
+    pending = {}
+    batch_started = None
+    loaded = 0
+    polls = 0
+
+    def flush_pending():
+        nonlocal rows, users, pending, batch_started, loaded
+        flush(cur, conn, s3, rows, pending, target, users)
+        if rows:
+            loaded += len(rows)
+            print(f"✅ Flushed {len(rows)} songplays ({loaded} total)")
+        rows, users, pending, batch_started = [], {}, {}, None
+
+    try:
+        while max_polls is None or polls < max_polls:
+            for key, content in poll(s3, source, skip):
+                lines = content.decode('utf-8').splitlines()
+                offset = loaded_progress.get(key, (0, False))[0]
+                for line_number in range(offset, len(lines)):
+                    line = lines[line_number]
+                    pending[key] = (line_number + 1, line_number + 1 == len(lines))
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    user = enrich_user(event)
+                    if user is not None and event['ts'] >= latest_ts.get(user[0], 0):
+                        users[user[0]] = user
+                        latest_ts[user[0]] = event['ts']
+                    row = enrich_event(event, song_index)
+                    if row is None:
+                        continue
+                    rows.append(row)
+                    if batch_started is None:
+                        batch_started = time.time()
+                    if len(rows) >= flush_rows:
+                        flush_pending()
+                if offset >= len(lines):
+                    pending[key] = (len(lines), True)
+
+            polls += 1
+            last_poll = max_polls is not None and polls >= max_polls
+            batch_due = batch_started is not None and time.time() - batch_started >= flush_seconds
+            if pending and (batch_due or last_poll or not rows):
+                flush_pending()
+
+            if not last_poll:
+                time.sleep(poll_seconds)
+
+    except KeyboardInterrupt:
+        if pending:
+            flush_pending()
+        print(f"🛑 Streaming stopped after loading {loaded} songplays.")
+
+    return loaded
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=SOURCE, help="Local directory or S3 prefix with event files")
+    parser.add_argument("--target", choices=["redshift", "postgres"], default=TARGET,
+                        help="COPY via S3 into Redshift or from STDIN into Postgres")
+    parser.add_argument("--max-polls", type=int, help="Stop after this many polls")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Mark the files already under the source as loaded (e.g. by the nightly batch)")
+    args = parser.parse_args()
+
+    if not args.source:
+        parser.error("no source given; set SOURCE under [STREAMING] in dwh.cfg or pass --source")
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+    cur = conn.cursor()
+
+    if args.skip_existing:
+        print(f"⏭️ Marked {skip_existing(cur, conn, make_s3_client(), args.source)} existing files as loaded")
+    stream(cur, conn, args.source, target=args.target, max_polls=args.max_polls)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
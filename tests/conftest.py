@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The scripts read dwh.cfg from the working directory when imported, so run the tests from a
+# directory holding a test configuration.
+config_dir = tempfile.mkdtemp()
+with open(os.path.join(config_dir, 'dwh.cfg'), 'w') as f:
+    f.write(
+        "[IAM_ROLE]\n"
+        "ARN='arn:aws:iam::123456789012:role/test'\n"
+        "[S3]\n"
+        "TRANSFORM_PREFIX='s3://test-bucket/transform'\n"
+        "[STREAMING]\n"
+        "STAGING_PREFIX='s3://test-bucket/staging'\n"
+        "TARGET=postgres\n"
+        "[AWS]\n"
+        "KEY=testing\n"
+        "SECRET=testing\n"
+    )
+os.chdir(config_dir)
+
+import pytest  # noqa: E402
+
+
+def make_event(page="NextSong", user_id="49", song="Catch You Baby", artist="Lonnie Gordon",
+               ts=1541903636796, level="paid", first_name="Chloe"):
+    """A log event in the format of the files under `log_data`."""
+    return {"artist": artist, "auth": "Logged In", "firstName": first_name, "gender": "F",
+            "itemInSession": 0, "lastName": "Cuevas", "length": 181.2, "level": level,
+            "location": "San Francisco-Oakland-Hayward, CA", "method": "PUT", "page": page,
+            "registration": 1540940782796.0, "sessionId": 648, "song": song, "status": 200,
+            "ts": ts, "userAgent": "Mozilla/5.0", "userId": user_id}
+
+
+@pytest.fixture
+def postgres():
+    """Connection to a scratch schema of the Postgres given by STREAMING_TEST_DSN."""
+    dsn = os.environ.get("STREAMING_TEST_DSN")
+    if not dsn:
+        pytest.skip("set STREAMING_TEST_DSN to run the tests against Postgres")
+
+    import psycopg2
+    from sql_queries import staging_events_table_create, staging_songs_table_create
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS dwh_test CASCADE; CREATE SCHEMA dwh_test;"
+                "SET search_path TO dwh_test;")
+    # The staging tables as in sql_queries without the Redshift distribution style, and plain
+    # Postgres versions of the analytical tables
+    for create in (staging_events_table_create, staging_songs_table_create):
+        cur.execute(create.replace("DISTSTYLE EVEN", ""))
+    cur.execute("""
+        CREATE TABLE dim_songs (song_id varchar(50), title varchar(255), artist_id varchar(50),
+                                year integer, duration numeric(10,5));
+        CREATE TABLE dim_artists (artist_id varchar(50), artist_name varchar(255),
+                                  artist_location varchar(255), latitude double precision,
+                                  longitude double precision);
+        CREATE TABLE dim_users (user_id integer NOT NULL, first_name varchar(50), last_name varchar(50),
+                                gender varchar(1), level varchar(10));
+        CREATE TABLE fact_songplays (songplay_id serial PRIMARY KEY, start_time timestamp NOT NULL,
+                                     user_id integer NOT NULL, level varchar(10) NOT NULL,
+                                     song_id varchar(50) NOT NULL, artist_id varchar(50) NOT NULL,
+                                     session_id integer NOT NULL, location varchar(255) NOT NULL,
+                                     user_agent varchar(255) NOT NULL);
+        CREATE TABLE dim_times (time_id serial PRIMARY KEY, start_time timestamp NOT NULL,
+                                hour integer, day integer, week integer, month integer,
+                                year integer, weekday integer);
+    """)
+    conn.commit()
+    yield conn, cur
+    conn.rollback()
+    cur.execute("DROP SCHEMA dwh_test CASCADE;")
+    conn.commit()
+    conn.close()
@@ -0,0 +1,182 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("psycopg2")
+pd = pytest.importorskip("pandas")
+
+import local_transform  # noqa: E402
+from conftest import make_event  # noqa: E402
+
+
+def epoch_ms(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+SONGS = pd.DataFrame([
+    {"song_id": "SOABCD", "title": "Catch You Baby", "artist_id": "ARXYZ",
+     "artist_name": "Lonnie Gordon", "year": 0, "duration": 181.2}
+])
+
+
+def read_events(tmp_path, events):
+    # Go through the JSON reader so the fixtures have the dtypes of the real log files
+    path = tmp_path / "log_data" / "2018" / "11"
+    path.mkdir(parents=True)
+    (path / "events.json").write_text("\n".join(json.dumps(event) for event in events) + "\n")
+    return local_transform.read_json_files(str(tmp_path / "log_data"))
+
+
+def test_dim_users_keeps_the_latest_row_when_the_level_changes(tmp_path):
+    # Out of order in the file, so the sort on ts decides which row wins
+    events = read_events(tmp_path, [
+        make_event(ts=epoch_ms(2018, 11, 20), level="paid", first_name="Chloe"),
+        make_event(ts=epoch_ms(2018, 11, 1), level="free", first_name="Chlo"),
+        make_event(ts=epoch_ms(2018, 11, 10), level="free", first_name="Chlo"),
+        make_event(user_id="8", ts=epoch_ms(2018, 11, 5), level="free", first_name="Kaylee"),
+    ])
+
+    users = local_transform.build_dim_users(local_transform.next_song_events(events))
+
+    assert users.to_dict("records") == [
+        {"user_id": 8, "first_name": "Kaylee", "last_name": "Cuevas", "gender": "F", "level": "free"},
+        {"user_id": 49, "first_name": "Chloe", "last_name": "Cuevas", "gender": "F", "level": "paid"},
+    ]
+
+
+def test_dim_users_only_counts_next_song_events_with_a_user(tmp_path):
+    events = read_events(tmp_path, [
+        make_event(user_id="49", ts=epoch_ms(2018, 11, 1), level="free"),
+        make_event(user_id="49", ts=epoch_ms(2018, 11, 2), level="paid", page="Upgrade"),
+        make_event(user_id="50", page="Home"),
+        make_event(user_id=""),
+        # Not matched to a song, but still a NextSong event like in user_table_insert
+        make_event(user_id="51", song="Unknown Song"),
+    ])
+
+    users = local_transform.build_dim_users(local_transform.next_song_events(events))
+
+    assert users["user_id"].tolist() == [49, 51]
+    assert users["level"].tolist() == ["free", "paid"]
+
+
+@pytest.mark.parametrize("ts, hour, day, week, month, year, weekday", [
+    # Sunday: EXTRACT(dow) is 0 and the ISO week still belongs to the previous Monday
+    ((2018, 11, 11, 2, 33, 56), 2, 11, 45, 11, 2018, 0),
+    # Monday in the ISO week 1 of the next year
+    ((2018, 12, 31, 23, 0, 0), 23, 31, 1, 12, 2018, 1),
+    # Sunday at the end of ISO week 52
+    ((2019, 12, 29, 0, 0, 0), 0, 29, 52, 12, 2019, 0),
+    ((2018, 11, 17, 12, 0, 0), 12, 17, 46, 11, 2018, 6),
+])
+def test_dim_times_matches_extract(tmp_path, ts, hour, day, week, month, year, weekday):
+    events = read_events(tmp_path, [make_event(ts=epoch_ms(*ts))])
+
+    times = local_transform.build_dim_times(local_transform.next_song_events(events), SONGS)
+
+    assert times.columns.tolist() == local_transform.time_columns
+    assert times.iloc[0]["start_time"] == pd.Timestamp(datetime(*ts))
+    assert times.iloc[0][local_transform.time_columns[1:]].astype("int64").tolist() == \
+        [hour, day, week, month, year, weekday]
+
+
+def test_dim_times_only_keeps_distinct_matched_song_plays(tmp_path):
+    kept = epoch_ms(2018, 11, 11, 2, 33, 56)
+    events = read_events(tmp_path, [
+        make_event(ts=kept),
+        make_event(ts=kept, user_id="8"),
+        make_event(ts=epoch_ms(2018, 11, 12), page="Home"),
+        make_event(ts=epoch_ms(2018, 11, 13), user_id=""),
+        make_event(ts=epoch_ms(2018, 11, 14), song="Unknown Song"),
+        make_event(ts=epoch_ms(2018, 11, 15), artist="Someone Else"),
+    ])
+
+    times = local_transform.build_dim_times(local_transform.next_song_events(events), SONGS)
+
+    assert times["start_time"].tolist() == [pd.Timestamp(2018, 11, 11, 2, 33, 56)]
+
+
+class FakeCursor:
+    """Returns the given rows for the query on the matching table, like psycopg2 would."""
+
+    def __init__(self, results):
+        self.results = results
+        self.description = None
+        self.rows = None
+
+    def execute(self, query):
+        columns, self.rows = next(value for table, value in self.results.items() if table in query)
+        self.description = [(column,) for column in columns]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_check_parity_with_identical_rows(tmp_path):
+    events = read_events(tmp_path, [make_event(ts=epoch_ms(2018, 11, 11, 2, 33, 56) + 796)])
+    plays = local_transform.next_song_events(events)
+    cur = FakeCursor({
+        "dim_users": (local_transform.user_columns, [(49, "Chloe", "Cuevas", "F", "paid")]),
+        "dim_times": (local_transform.time_columns,
+                      [(datetime(2018, 11, 11, 2, 33, 56, 796000), 2, 11, 45, 11, 2018, 0)])
+    })
+
+    parity = local_transform.check_parity(cur, local_transform.build_dim_users(plays),
+                                          local_transform.build_dim_times(plays, SONGS))
+
+    assert parity == {"dim_users": True, "dim_times": True}
+
+
+def test_copy_dataframe_needs_a_transform_prefix(monkeypatch):
+    monkeypatch.setattr(local_transform, "TRANSFORM_PREFIX", "")
+
+    with pytest.raises(ValueError, match="TRANSFORM_PREFIX"):
+        local_transform.copy_dataframe(None, None, pd.DataFrame(), "dim_users", local_transform.user_columns)
+
+
+def insert_staging(cur, events):
+    cur.executemany(
+        """
+        INSERT INTO staging_events (artist, auth, first_name, gender, item_in_session, last_name, length,
+                                    level, location, method, page, registration, session_id, song,
+                                    status, ts, user_agent, user_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """,
+        [(e["artist"], e["auth"], e["firstName"], e["gender"], e["itemInSession"], e["lastName"], e["length"],
+          e["level"], e["location"], e["method"], e["page"], e["registration"], e["sessionId"], e["song"],
+          e["status"], e["ts"], e["userAgent"], int(e["userId"]) if e["userId"] else None) for e in events])
+    cur.executemany(
+        """
+        INSERT INTO staging_songs (num_songs, artist_id, artist_latitude, artist_longitude, artist_location,
+                                   artist_name, song_id, title, duration, year)
+        VALUES (1, %(artist_id)s, NULL, NULL, NULL, %(artist_name)s, %(song_id)s, %(title)s,
+                %(duration)s, %(year)s);
+        """,
+        SONGS.to_dict("records"))
+
+
+def test_local_transforms_match_the_sql_inserts(postgres, tmp_path):
+    from sql_queries import songplays_table_insert, time_table_insert, user_table_insert
+
+    conn, cur = postgres
+    events = [
+        make_event(ts=epoch_ms(2018, 11, 1, 8) + 123, level="free"),
+        make_event(ts=epoch_ms(2018, 11, 11, 2, 33, 56) + 796, level="paid"),
+        make_event(ts=epoch_ms(2018, 11, 20), level="paid", page="Upgrade"),
+        make_event(user_id="8", ts=epoch_ms(2018, 12, 31, 23, 59, 59) + 999, first_name="Kaylee", level="free"),
+        make_event(user_id="8", ts=epoch_ms(2019, 12, 29, 12), first_name="Kaylee", level="paid"),
+        make_event(user_id="51", ts=epoch_ms(2018, 11, 17), song="Unknown Song"),
+        make_event(user_id="", ts=epoch_ms(2018, 11, 18)),
+        make_event(user_id="50", ts=epoch_ms(2018, 11, 19), page="Home"),
+    ]
+    insert_staging(cur, events)
+    for query in (songplays_table_insert, user_table_insert, time_table_insert):
+        cur.execute(query)
+
+    plays = local_transform.next_song_events(read_events(tmp_path, events))
+    users, times = local_transform.build_dim_users(plays), local_transform.build_dim_times(plays, SONGS)
+
+    assert (len(users), len(times)) == (3, 4)
+    assert local_transform.check_parity(cur, users, times) == {"dim_users": True, "dim_times": True}
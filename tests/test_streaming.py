@@ -0,0 +1,158 @@
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("psycopg2")
+
+import streaming  # noqa: E402
+from conftest import make_event  # noqa: E402
+
+SONG_INDEX = {("Catch You Baby", "Lonnie Gordon"): ("SOABCD", "ARXYZ")}
+
+
+def write_events(path, events):
+    with open(path, "w") as f:
+        f.write("\n".join(json.dumps(event) for event in events) + "\n")
+
+
+def test_enrich_event_builds_songplay_row():
+    row = streaming.enrich_event(make_event(), SONG_INDEX)
+
+    assert row == (datetime(2018, 11, 11, 2, 33, 56, 796000), 49, "paid", "SOABCD", "ARXYZ",
+                   648, "San Francisco-Oakland-Hayward, CA", "Mozilla/5.0")
+
+
+@pytest.mark.parametrize("event", [
+    make_event(page="Home"),
+    make_event(user_id=""),
+    make_event(song="Unknown Song"),
+    make_event(artist="Someone Else"),
+])
+def test_enrich_event_skips_events_like_the_sql_load(event):
+    assert streaming.enrich_event(event, SONG_INDEX) is None
+
+
+def test_enrich_user_keeps_next_song_events_with_a_user_even_if_unmatched():
+    assert streaming.enrich_user(make_event(song="Unknown Song")) == (49, "Chloe", "Cuevas", "F", "paid")
+    assert streaming.enrich_user(make_event(page="Home")) is None
+    assert streaming.enrich_user(make_event(user_id="")) is None
+
+
+def test_encode_batch_writes_gzip_csv():
+    rows = [(datetime(2018, 11, 11, 2, 33, 56, 796000), 49, "paid", "SOABCD", "ARXYZ",
+             648, "San Francisco, CA", 'Mozilla/5.0 "quoted"')]
+
+    with gzip.GzipFile(fileobj=io.BytesIO(streaming.encode_batch(rows))) as gz:
+        decoded = list(csv.reader(io.TextIOWrapper(gz, encoding="utf-8", newline="")))
+
+    assert decoded == [["2018-11-11 02:33:56.796000", "49", "paid", "SOABCD", "ARXYZ",
+                        "648", "San Francisco, CA", 'Mozilla/5.0 "quoted"']]
+
+
+def test_stream_flushes_inside_a_file_and_tracks_line_offsets(tmp_path, monkeypatch):
+    events = [make_event(ts=1541903636796 + i) for i in range(5)] + [make_event(page="Home")]
+    write_events(os.path.join(tmp_path, "2018-11-11-events.json"), events)
+
+    flushes = []
+    monkeypatch.setattr(streaming, "make_s3_client", lambda: None)
+    monkeypatch.setattr(streaming, "load_song_index", lambda cur: SONG_INDEX)
+    monkeypatch.setattr(streaming, "load_progress", lambda cur, conn: {})
+    monkeypatch.setattr(streaming, "flush", lambda cur, conn, s3, rows, progress, target, users:
+                        flushes.append((len(rows), dict(progress))))
+
+    loaded = streaming.stream(None, None, str(tmp_path), flush_rows=2, poll_seconds=0, max_polls=1)
+
+    path = os.path.join(tmp_path, "2018-11-11-events.json")
+    assert loaded == 5
+    assert flushes == [(2, {path: (2, False)}), (2, {path: (4, False)}), (1, {path: (6, True)})]
+
+
+def test_stream_resumes_after_last_loaded_line(tmp_path, monkeypatch):
+    events = [make_event(ts=1541903636796 + i) for i in range(4)]
+    path = os.path.join(tmp_path, "2018-11-11-events.json")
+    write_events(path, events)
+    write_events(os.path.join(tmp_path, "2018-11-10-events.json"), events)
+
+    flushes = []
+    monkeypatch.setattr(streaming, "make_s3_client", lambda: None)
+    monkeypatch.setattr(streaming, "load_song_index", lambda cur: SONG_INDEX)
+    monkeypatch.setattr(streaming, "load_progress", lambda cur, conn: {
+        path: (3, False), os.path.join(tmp_path, "2018-11-10-events.json"): (4, True)})
+    monkeypatch.setattr(streaming, "flush", lambda cur, conn, s3, rows, progress, target, users:
+                        flushes.append((len(rows), dict(progress))))
+
+    loaded = streaming.stream(None, None, str(tmp_path), poll_seconds=0, max_polls=1)
+
+    assert loaded == 1
+    assert flushes == [(1, {path: (4, True)})]
+
+
+def test_stream_passes_the_latest_row_of_each_user(tmp_path, monkeypatch):
+    events = [make_event(ts=1541903636796, level="paid"), make_event(ts=1541903600000, level="free"),
+              make_event(user_id="8", song="Unknown Song", level="free")]
+    write_events(os.path.join(tmp_path, "2018-11-11-events.json"), events)
+
+    flushed_users = []
+    monkeypatch.setattr(streaming, "make_s3_client", lambda: None)
+    monkeypatch.setattr(streaming, "load_song_index", lambda cur: SONG_INDEX)
+    monkeypatch.setattr(streaming, "load_progress", lambda cur, conn: {})
+    monkeypatch.setattr(streaming, "flush", lambda cur, conn, s3, rows, progress, target, users:
+                        flushed_users.append(dict(users)))
+
+    streaming.stream(None, None, str(tmp_path), poll_seconds=0, max_polls=1)
+
+    assert flushed_users == [{49: (49, "Chloe", "Cuevas", "F", "paid"), 8: (8, "Chloe", "Cuevas", "F", "free")}]
+
+
+def test_stream_end_to_end_from_moto_s3_into_postgres(postgres):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    conn, cur = postgres
+    cur.execute("""
+        INSERT INTO dim_songs VALUES ('SOABCD', 'Catch You Baby', 'ARXYZ', 0, 181.2);
+        INSERT INTO dim_artists VALUES ('ARXYZ', 'Lonnie Gordon', NULL, NULL, NULL);
+        INSERT INTO dim_users VALUES (49, 'Chloe', 'Cuevas', 'F', 'paid');
+    """)
+    conn.commit()
+    events = [make_event(ts=1541903636796), make_event(ts=1541903700000, level="free"),
+              make_event(page="Home"), make_event(song="Unknown Song"),
+              make_event(user_id="8", ts=1541903800000, level="free")]
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test-bucket")
+        s3.put_object(Bucket="test-bucket", Key="log_data/2018/11/2018-11-11-events.json",
+                      Body="\n".join(json.dumps(event) for event in events))
+
+        loaded = streaming.stream(cur, conn, "s3://test-bucket/log_data", poll_seconds=0,
+                                  target="postgres", max_polls=1)
+        # A restart must not load the same file again
+        reloaded = streaming.stream(cur, conn, "s3://test-bucket/log_data", poll_seconds=0,
+                                    target="postgres", max_polls=1)
+
+    assert (loaded, reloaded) == (3, 0)
+
+    cur.execute("SELECT start_time, user_id, level, song_id, artist_id FROM fact_songplays ORDER BY start_time;")
+    assert cur.fetchall() == [
+        (datetime(2018, 11, 11, 2, 33, 56, 796000), 49, "paid", "SOABCD", "ARXYZ"),
+        (datetime(2018, 11, 11, 2, 35), 49, "free", "SOABCD", "ARXYZ"),
+        (datetime(2018, 11, 11, 2, 36, 40), 8, "free", "SOABCD", "ARXYZ"),
+    ]
+    cur.execute("SELECT start_time, hour, day, month, year, weekday FROM dim_times ORDER BY start_time;")
+    assert cur.fetchall() == [
+        (datetime(2018, 11, 11, 2, 33, 56, 796000), 2, 11, 11, 2018, 0),
+        (datetime(2018, 11, 11, 2, 35), 2, 11, 11, 2018, 0),
+        (datetime(2018, 11, 11, 2, 36, 40), 2, 11, 11, 2018, 0),
+    ]
+    # User 49's latest event replaced their row; user 8 was first seen in the stream
+    cur.execute("SELECT user_id, level FROM dim_users ORDER BY user_id;")
+    assert cur.fetchall() == [(8, "free"), (49, "free")]
+    cur.execute("SELECT file_key, line_offset, complete FROM streaming_progress;")
+    assert cur.fetchall() == [("log_data/2018/11/2018-11-11-events.json", 5, True)]
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("psycopg2")
+pytest.importorskip("pyarrow")
+
+import unload  # noqa: E402
+
+
+def test_build_unload_query_doubles_quotes_and_drops_the_semicolon():
+    statement = unload.build_unload_query("SELECT * FROM fact_songplays WHERE level = 'paid';",
+                                          "s3://test-bucket/exports/paid/")
+
+    assert "UNLOAD ('SELECT * FROM fact_songplays WHERE level = ''paid''')" in statement
+    assert "TO 's3://test-bucket/exports/paid/'" in statement
+    assert "PARTITION BY" not in statement
+
+
+def test_build_unload_query_partitions_by_the_given_columns():
+    statement = unload.build_unload_query("SELECT * FROM dim_times", "s3://test-bucket/exports/dim_times/",
+                                          ["year", "month"])
+
+    assert "PARTITION BY (year, month) INCLUDE" in statement
+    assert "PARALLEL ON" in statement and "MANIFEST VERBOSE" in statement
+
+
+def test_query_target_splits_on_the_first_equals_sign():
+    name, target = unload.query_target("paid_plays = SELECT * FROM fact_songplays WHERE level = 'paid'",
+                                       ["year"])
+
+    assert name == "paid_plays"
+    assert target == {"query": "SELECT * FROM fact_songplays WHERE level = 'paid'", "partition_by": ["year"]}
+
+
+@pytest.mark.parametrize("spec", ["SELECT 1", "=SELECT 1", "name="])
+def test_query_target_rejects_a_missing_name_or_query(spec):
+    with pytest.raises(ValueError):
+        unload.query_target(spec)
+
+
+@pytest.fixture
+def s3():
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        yield client
+
+
+def test_download_parts_keeps_the_partition_folders(s3, tmp_path):
+    keys = ["exports/fact_songplays/year=2018/month=11/0000_part_00.parquet",
+            "exports/fact_songplays/year=2018/month=12/0000_part_00.parquet",
+            "exports/fact_songplays/year=2018/month=12/0001_part_00.parquet"]
+    for key in keys:
+        s3.put_object(Bucket="test-bucket", Key=key, Body=key.encode())
+
+    paths = unload.download_parts(s3, ["s3://test-bucket/" + key for key in keys], str(tmp_path), max_workers=2)
+
+    relative = [os.path.relpath(path, tmp_path) for path in paths]
+    assert relative == [os.path.join("year=2018", "month=11", "0000_part_00.parquet"),
+                        os.path.join("year=2018", "month=12", "0000_part_00.parquet"),
+                        os.path.join("year=2018", "month=12", "0001_part_00.parquet")]
+    for key, path in zip(keys, paths):
+        with open(path, "rb") as f:
+            assert f.read() == key.encode()
+
+
+def test_download_parts_of_a_single_part(s3, tmp_path):
+    key = "exports/dim_users/0000_part_00.parquet"
+    s3.put_object(Bucket="test-bucket", Key=key, Body=b"part")
+
+    paths = unload.download_parts(s3, ["s3://test-bucket/" + key], str(tmp_path))
+
+    assert paths == [os.path.join(str(tmp_path), "0000_part_00.parquet")]
+
+
+def test_read_manifest_lists_the_part_urls(s3):
+    entries = [{"url": "s3://test-bucket/exports/dim_users/0000_part_00.parquet", "meta": {"content_length": 4}}]
+    s3.put_object(Bucket="test-bucket", Key="exports/dim_users/manifest", Body=json.dumps({"entries": entries}))
+
+    assert unload.read_manifest(s3, "s3://test-bucket/exports/dim_users/manifest") == [entries[0]["url"]]
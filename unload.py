@@ -0,0 +1,291 @@
+import configparser
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import boto3
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+config = configparser.ConfigParser()
+config.read('dwh.cfg')
+
+DWH_ROLE_ARN = config.get('IAM_ROLE', 'ARN')
+UNLOAD_PREFIX = config.get('S3', 'UNLOAD_PREFIX', fallback='').strip("'")
+
+# Tables (or queries) that can be exported. Tables partitioned by (year, month) derive
+# those columns from their timestamp so each month lands in its own S3 prefix.
+unload_targets = {
+    "fact_songplays": {
+        "query": """
+            SELECT sp.*,
+                   EXTRACT(year FROM sp.start_time) AS year,
+                   EXTRACT(month FROM sp.start_time) AS month
+            FROM fact_songplays sp
+        """,
+        "partition_by": ["year", "month"]
+    },
+    "dim_times": {
+        "query": "SELECT * FROM dim_times",
+        "partition_by": ["year", "month"]
+    },
+    "dim_users": {
+        "query": "SELECT * FROM dim_users",
+        "partition_by": []
+    },
+    "dim_songs": {
+        "query": "SELECT * FROM dim_songs",
+        "partition_by": []
+    },
+    "dim_artists": {
+        "query": "SELECT * FROM dim_artists",
+        "partition_by": []
+    }
+}
+
+
+def query_target(spec, partition_by=None):
+    """
+        Build an export target for an ad-hoc query given as `NAME=SQL`.
+
+        Args:
+            spec (str): Export name and SELECT statement separated by the first '='.
+            partition_by (list, optional): Columns of the query result to partition the output by.
+
+        Returns:
+            tuple: (name, target) with the target shaped like the entries of `unload_targets`.
+
+        Raises:
+            ValueError: If the name or the query is missing.
+    """
+    name, _, query = spec.partition('=')
+    name, query = name.strip(), query.strip()
+    if not name or not query:
+        raise ValueError(f"expected NAME=SQL, got {spec!r}")
+    return name, {"query": query, "partition_by": list(partition_by or [])}
+
+
+def build_unload_query(query, destination, partition_by=None):
+    """
+        Build an UNLOAD statement that writes the result of `query` as Parquet.
+
+        Every slice writes its own part files (PARALLEL ON) and Redshift writes a
+        manifest listing them next to the data.
+
+        Args:
+            query (str): SELECT statement to export.
+            destination (str): S3 prefix to unload into, e.g. `s3://bucket/exports/fact_songplays/`.
+            partition_by (list, optional): Columns to partition the output by.
+
+        Returns:
+            str: The UNLOAD statement.
+    """
+    # UNLOAD takes the query as a string literal, so single quotes have to be doubled
+    quoted_query = query.strip().rstrip(';').replace("'", "''")
+    partition_clause = ""
+    if partition_by:
+        partition_clause = "PARTITION BY ({}) INCLUDE".format(", ".join(partition_by))
+
+    return (
+        """
+        UNLOAD ('{}')
+        TO '{}'
+        IAM_ROLE {}
+        FORMAT PARQUET
+        {}
+        PARALLEL ON
+        MANIFEST VERBOSE
+        ALLOWOVERWRITE
+        """
+    ).format(quoted_query, destination, DWH_ROLE_ARN, partition_clause)
+
+
+def unload_tables(cur, conn, names, prefix=UNLOAD_PREFIX, targets=None):
+    """
+        Export the given tables or queries to S3.
+
+        Args:
+            cur (psycopg2.extensions.cursor): Cursor object to execute PostgreSQL commands.
+            conn (psycopg2.extensions.connection): Connection object to commit transactions.
+            names (list): Keys of `targets` to export.
+            prefix (str): S3 prefix under which each export gets its own folder.
+            targets (dict, optional): Name -> {"query", "partition_by"}. Defaults to `unload_targets`.
+
+        Returns:
+            dict: Manifest S3 URI for each exported name.
+    """
+    if targets is None:
+        targets = unload_targets
+
+    manifests = {}
+    for name in names:
+        target = targets[name]
+        destination = "{}/{}/".format(prefix.rstrip('/'), name)
+
+        print(f"⏳ Unloading {name} to {destination}")
+        start_time = time.time()
+        cur.execute(build_unload_query(target["query"], destination, target["partition_by"]))
+        conn.commit()
+        print(f"⏱️ Unload time: {time.time() - start_time:.4f} seconds")
+
+        manifests[name] = destination + "manifest"
+    return manifests
+
+
+def read_manifest(s3, manifest_uri):
+    """
+        Read the part file URIs listed in an UNLOAD manifest.
+
+        Args:
+            s3 (boto3.client): S3 client.
+            manifest_uri (str): S3 URI of the manifest written by UNLOAD.
+
+        Returns:
+            list: S3 URIs of the Parquet part files.
+    """
+    url = urlparse(manifest_uri)
+    body = s3.get_object(Bucket=url.netloc, Key=url.path.lstrip('/'))['Body'].read()
+    return [entry['url'] for entry in json.loads(body)['entries']]
+
+
+def download_parts(s3, part_uris, local_dir, max_workers=8):
+    """
+        Download Parquet part files in parallel, keeping the partition folders.
+
+        Args:
+            s3 (boto3.client): S3 client.
+            part_uris (list): S3 URIs of the part files.
+            local_dir (str): Directory to download into.
+            max_workers (int): Number of download threads.
+
+        Returns:
+            list: Local paths of the downloaded files.
+    """
+    if not part_uris:
+        return []
+
+    # Everything after the export folder is the partition path (year=2018/month=11/...). Partition
+    # folders shared by every part are part of the common prefix, so strip those back off
+    common_prefix = os.path.commonpath([os.path.dirname(urlparse(uri).path) for uri in part_uris])
+    while '=' in os.path.basename(common_prefix):
+        common_prefix = os.path.dirname(common_prefix)
+
+    def download(uri):
+        url = urlparse(uri)
+        local_path = os.path.join(local_dir, os.path.relpath(url.path, common_prefix))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        s3.download_file(url.netloc, url.path.lstrip('/'), local_path)
+        return local_path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download, part_uris))
+
+
+def read_parts(paths, max_workers=8):
+    """
+        Read downloaded Parquet part files into a single pandas DataFrame.
+
+        Files are memory-mapped and read on a thread pool; Arrow releases the GIL
+        while decoding so the parts are read concurrently.
+
+        Args:
+            paths (list): Local paths of the Parquet part files.
+            max_workers (int): Number of reader threads.
+
+        Returns:
+            pd.DataFrame: Concatenated contents of all parts.
+    """
+    if not paths:
+        return pd.DataFrame()
+
+    def read(path):
+        return pq.read_table(path, memory_map=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tables = list(executor.map(read, paths))
+
+    return pa.concat_tables(tables).to_pandas()
+
+
+def fetch_export(manifest_uri, local_dir, max_workers=8):
+    """
+        Download every part listed in an UNLOAD manifest and load it into pandas.
+
+        Args:
+            manifest_uri (str): S3 URI of the manifest written by UNLOAD.
+            local_dir (str): Directory to download into.
+            max_workers (int): Number of download and reader threads.
+
+        Returns:
+            pd.DataFrame: The exported rows.
+    """
+    s3 = boto3.client('s3',
+                      aws_access_key_id=config.get('AWS', 'KEY'),
+                      aws_secret_access_key=config.get('AWS', 'SECRET'))
+
+    start_time = time.time()
+    part_uris = read_manifest(s3, manifest_uri)
+    paths = download_parts(s3, part_uris, local_dir, max_workers)
+    df = read_parts(paths, max_workers)
+    print(f"⏱️ Fetched {len(part_uris)} parts ({len(df)} rows) in {time.time() - start_time:.4f} seconds")
+    return df
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tables", nargs="*",
+                        help="Tables to export (default: all of {}, or none with --query)"
+                        .format(", ".join(unload_targets)))
+    parser.add_argument("--query", metavar="NAME=SQL", help="Also export the result of an ad-hoc query as NAME")
+    parser.add_argument("--partition-by", metavar="COLUMNS",
+                        help="Comma separated columns of the --query result to partition by")
+    parser.add_argument("--prefix", default=UNLOAD_PREFIX, help="S3 prefix to unload into")
+    parser.add_argument("--download", metavar="DIR", help="Download the exports into this directory")
+    parser.add_argument("--workers", type=int, default=8, help="Number of download/reader threads")
+    args = parser.parse_args()
+
+    if not args.prefix:
+        parser.error("no S3 prefix given; set UNLOAD_PREFIX under [S3] in dwh.cfg or pass --prefix")
+    if args.partition_by and not args.query:
+        parser.error("--partition-by only applies to --query")
+    unknown = [name for name in args.tables if name not in unload_targets]
+    if unknown:
+        parser.error("unknown tables {}; expected some of {}".format(", ".join(unknown), ", ".join(unload_targets)))
+
+    targets = dict(unload_targets)
+    names = args.tables or ([] if args.query else list(unload_targets))
+    if args.query:
+        partition_by = [c.strip() for c in args.partition_by.split(',')] if args.partition_by else []
+        try:
+            name, target = query_target(args.query, partition_by)
+        except ValueError as e:
+            parser.error(str(e))
+        if name in targets:
+            parser.error(f"--query name {name!r} clashes with a table export")
+        targets[name] = target
+        names.append(name)
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}"
+                            .format(*config['DWH'].values()))
+    cur = conn.cursor()
+
+    manifests = unload_tables(cur, conn, names, args.prefix, targets)
+    conn.close()
+
+    for name, manifest_uri in manifests.items():
+        print(f"📄 {name} manifest: {manifest_uri}")
+        if args.download:
+            df = fetch_export(manifest_uri, os.path.join(args.download, name), args.workers)
+            print(df.head())
+
+    print("✅ Done exporting tables!")
+
+
+if __name__ == "__main__":
+    main()